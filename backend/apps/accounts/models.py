@@ -7,6 +7,7 @@ class User(AbstractUser):
     
     bio = models.TextField(blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     website = models.URLField(blank=True, null=True)
     location = models.CharField(max_length=100, blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
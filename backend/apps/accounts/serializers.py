@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from apps.blog.fieldsets import SparseFieldsetMixin
+from apps.media.serializers import SrcsetField
 from .models import User
 
 
@@ -27,13 +29,15 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for user profile."""
     
+    avatar_srcset = SrcsetField('avatar')
+    
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 
-                 'avatar', 'website', 'location', 'birth_date', 'is_verified', 
+                 'avatar', 'avatar_srcset', 'website', 'location', 'birth_date', 'is_verified', 
                  'date_joined', 'last_login')
         read_only_fields = ('id', 'date_joined', 'last_login')
 
@@ -70,5 +70,5 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 def user_profile(request):
     """Get current user profile."""
     
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(request.user, context={'request': request})
     return Response(serializer.data)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Category, Tag, Comment, Like, PostView
+from .models import Post, Category, Tag, Comment, Like, PostView, PostViewDaily
 
 
 @admin.register(Category)
@@ -67,3 +67,11 @@ class PostViewAdmin(admin.ModelAdmin):
     list_filter = ['created_at', 'post__author']
     search_fields = ['post__title', 'ip_address']
     date_hierarchy = 'created_at'
+
+
+@admin.register(PostViewDaily)
+class PostViewDailyAdmin(admin.ModelAdmin):
+    list_display = ['post', 'day', 'views', 'unique_ips']
+    list_filter = ['day']
+    search_fields = ['post__title']
+    date_hierarchy = 'day'
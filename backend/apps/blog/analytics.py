@@ -0,0 +1,242 @@
+"""
+PostView analytics rollups.
+
+Raw ``PostView`` rows are folded into one ``PostViewDaily`` row per post
+and day as they are loaded from the spool, in the same transaction, so
+the rollups and the raw table always agree.  Distinct visitors are
+tracked with HyperLogLog sketches (see ``hll``), one per rollup row plus
+an all-time sketch per post in ``PostVisitorSketch``.  Read APIs only
+touch the rollups.  Raw rows older than ``POST_VIEW_RETENTION_DAYS`` are
+pruned in batches once their day has been rebuilt from the complete raw
+data and recorded in ``PostViewRollupDay``.  Both writers of a day's
+rollups take the day's advisory lock on PostgreSQL, so a rebuild never
+wipes the increments of a concurrent drain.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .search import uses_postgres
+from .stats import invalidate_post_stats
+
+MAX_RANGE_DAYS = 366
+
+# First key of the per-day advisory locks; the second is the day's ordinal.
+ROLLUP_LOCK_KEY = 7201
+
+
+def _top_referers():
+    return getattr(settings, 'POST_VIEW_TOP_REFERERS', 10)
+
+
+def _local_day(value):
+    return timezone.localdate(value)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _trim_referers(counts):
+    return dict(Counter(counts).most_common(_top_referers()))
+
+
+def lock_days(days):
+    """Hold the rollup locks of ``days`` until the transaction ends.
+
+    Taken in day order, so writers of several days can't deadlock.  Other
+    databases serialize writers themselves.
+    """
+    if not uses_postgres():
+        return
+    with connection.cursor() as cursor:
+        for day in sorted(days):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ROLLUP_LOCK_KEY, day.toordinal()])
+
+
+def merge_visitor_sketches(visitors):
+    """Add ``{post_id: ips}`` to the posts' all-time visitor sketches."""
+    from .models import PostVisitorSketch
+
+    if not visitors:
+        return
+    with transaction.atomic():
+        PostVisitorSketch.objects.bulk_create(
+            [PostVisitorSketch(post_id=post_id) for post_id in visitors],
+            ignore_conflicts=True,
+        )
+        rows = list(PostVisitorSketch.objects.select_for_update().filter(
+            post_id__in=visitors,
+        ).order_by('post_id'))
+        for row in rows:
+            sketch = HyperLogLog.from_bytes(row.sketch).update(visitors[row.post_id])
+            row.sketch = sketch.to_bytes()
+            row.unique_visitors = sketch.count()
+        PostVisitorSketch.objects.bulk_update(rows, ['sketch', 'unique_visitors'])
+        invalidate_post_stats(visitors)
+
+
+def record_views(views):
+    """Fold newly inserted PostView rows into their daily rollups.
+
+    Call inside the transaction that inserted ``views``.  View and referer
+    counts are added as deltas and visitor IPs are added to the day's and
+    the post's sketches, so no raw rows are read back.  Referers outside
+    the top list are dropped, so referer counts are exact only for
+    referers that never fell out of it.
+    """
+    from .models import PostViewDaily
+
+    counts = Counter()
+    referers = defaultdict(Counter)
+    visitors = defaultdict(set)
+    for view in views:
+        key = (view.post_id, _local_day(view.created_at))
+        counts[key] += 1
+        visitors[key].add(view.ip_address)
+        if view.referer:
+            referers[key][view.referer] += 1
+    if not counts:
+        return 0
+
+    post_ids = {post_id for post_id, _ in counts}
+    days = {day for _, day in counts}
+    with transaction.atomic():
+        lock_days(days)
+        PostViewDaily.objects.bulk_create(
+            [PostViewDaily(post_id=post_id, day=day) for post_id, day in counts],
+            ignore_conflicts=True,
+        )
+        rows = [
+            row for row in PostViewDaily.objects.select_for_update().filter(
+                post_id__in=post_ids, day__in=days,
+            ).order_by('pk')
+            if (row.post_id, row.day) in counts
+        ]
+        post_visitors = defaultdict(set)
+        for row in rows:
+            key = (row.post_id, row.day)
+            sketch = HyperLogLog.from_bytes(row.visitor_sketch).update(visitors[key])
+            row.views += counts[key]
+            row.visitor_sketch = sketch.to_bytes()
+            row.unique_ips = sketch.count()
+            row.referers = _trim_referers(Counter(row.referers) + referers[key])
+            post_visitors[row.post_id] |= visitors[key]
+        PostViewDaily.objects.bulk_update(rows, ['views', 'unique_ips', 'referers', 'visitor_sketch'])
+        merge_visitor_sketches(post_visitors)
+    return len(rows)
+
+
+def rebuild_day(day):
+    """Recompute every rollup of ``day`` from the raw PostView rows.
+
+    Only correct while the day's raw rows are complete; days already in
+    ``PostViewRollupDay`` may have been pruned and are left alone.
+    """
+    from .models import PostView, PostViewDaily, PostViewRollupDay
+
+    raw = PostView.objects.filter(
+        created_at__gte=_day_start(day),
+        created_at__lt=_day_start(day + datetime.timedelta(days=1)),
+    )
+    with transaction.atomic():
+        # Drains of the day wait, then add their views to the rebuilt rows.
+        lock_days([day])
+        if PostViewRollupDay.objects.select_for_update().filter(day=day).exists():
+            return False
+        referers = defaultdict(Counter)
+        for row in raw.exclude(referer='').values('post_id', 'referer').annotate(views=Count('pk')):
+            referers[row['post_id']][row['referer']] = row['views']
+        visitors = defaultdict(set)
+        for post_id, ip_address in raw.values_list('post_id', 'ip_address').distinct():
+            visitors[post_id].add(ip_address)
+        PostViewDaily.objects.filter(day=day).delete()
+        PostViewDaily.objects.bulk_create([
+            PostViewDaily(
+                post_id=row['post_id'],
+                day=day,
+                views=row['views'],
+                unique_ips=len(visitors[row['post_id']]),
+                referers=_trim_referers(referers[row['post_id']]),
+                visitor_sketch=HyperLogLog().update(visitors[row['post_id']]).to_bytes(),
+            )
+            for row in raw.values('post_id').annotate(views=Count('pk'))
+        ])
+        # Merging is idempotent, so visitors already counted are not counted twice.
+        merge_visitor_sketches(visitors)
+        PostViewRollupDay.objects.create(day=day)
+    return True
+
+
+def prune_post_views(retention_days=None, batch_size=None):
+    """Delete raw PostView rows older than the retention period.
+
+    Each day is rebuilt and recorded as rolled up before any of its rows
+    are deleted, so an interrupted run can simply be repeated.  Returns the
+    number of rows deleted.
+    """
+    from .models import PostView
+
+    if retention_days is None:
+        retention_days = getattr(settings, 'POST_VIEW_RETENTION_DAYS', 90)
+    batch_size = batch_size or getattr(settings, 'POST_VIEW_PRUNE_BATCH_SIZE', 5000)
+    if retention_days <= 0:
+        return 0
+
+    cutoff = _day_start(timezone.localdate() - datetime.timedelta(days=retention_days))
+    expired = PostView.objects.filter(created_at__lt=cutoff)
+    for day in expired.dates('created_at', 'day'):
+        rebuild_day(day)
+
+    deleted = 0
+    while True:
+        batch = list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += PostView.objects.filter(pk__in=batch).delete()[0]
+
+
+def _rollups(post_id, start, end):
+    from .models import PostViewDaily
+
+    return PostViewDaily.objects.filter(post_id=post_id, day__gte=start, day__lte=end)
+
+
+def daily_views(post_id, start, end):
+    """Return ``[{day, views, unique_ips}]`` for every day in the range, zeros included."""
+    rows = {
+        row['day']: row
+        for row in _rollups(post_id, start, end).values('day', 'views', 'unique_ips')
+    }
+    series = []
+    day = start
+    while day <= end:
+        series.append(rows.get(day, {'day': day, 'views': 0, 'unique_ips': 0}))
+        day += datetime.timedelta(days=1)
+    return series
+
+
+def view_totals(post_id, start, end):
+    """Return total views and the estimated distinct visitor IPs for the range."""
+    views = 0
+    sketch = HyperLogLog()
+    for day_views, visitor_sketch in _rollups(post_id, start, end).values_list('views', 'visitor_sketch'):
+        views += day_views
+        sketch.merge(HyperLogLog.from_bytes(visitor_sketch))
+    return {'views': views, 'unique_ips': sketch.count()}
+
+
+def top_referers(post_id, start, end, limit=None):
+    """Return ``[{referer, views}]`` for the range, most views first."""
+    counts = Counter()
+    for referers in _rollups(post_id, start, end).values_list('referers', flat=True):
+        counts.update(referers)
+    return [
+        {'referer': referer, 'views': views}
+        for referer, views in counts.most_common(limit or _top_referers())
+    ]
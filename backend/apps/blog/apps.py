@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.blog'
+
+    def ready(self):
+        import atexit
+        from . import signals  # noqa: F401
+        from .counters import view_counter
+        from .related import related_posts_refresher
+        from .spool import post_view_spool
+
+        # Flush buffered view counts, spooled views and pending related
+        # post refreshes when the worker shuts down.
+        atexit.register(view_counter.flush)
+        atexit.register(post_view_spool.flush)
+        atexit.register(related_posts_refresher.flush)
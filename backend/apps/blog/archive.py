@@ -0,0 +1,114 @@
+"""
+Month/year archive counts.
+
+``PostArchiveBucket`` rows count posts per (month, status, category,
+author) and are adjusted by post signals whenever a post enters or
+leaves a bucket, e.g. on publishing, so archive navigation sums a few
+bucket rows instead of grouping every post by month.  Several rows may
+exist for the same bucket (the nullable category can't be made unique
+portably); readers always sum them.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+ARCHIVE_FIELDS = ('status', 'published_at', 'created_at', 'category_id', 'author_id')
+
+
+def bucket_of(values):
+    """Return the bucket ``(month, status, category_id, author_id)`` of post field values.
+
+    Returns None if any field it depends on is missing.
+    """
+    if any(field not in values for field in ARCHIVE_FIELDS):
+        return None
+    moment = values['published_at'] or values['created_at']
+    if moment is None:
+        return None
+    month = timezone.localtime(moment).date().replace(day=1)
+    return (month, values['status'], values['category_id'], values['author_id'])
+
+
+def archive_key(post, stored=None):
+    """Return the bucket of a post; ``stored`` supplies the values of deferred fields."""
+    return bucket_of({**(stored or {}), **post.__dict__})
+
+
+def adjust_archive(key, delta):
+    """Add ``delta`` to a row of bucket ``key`` with a conditional F() update.
+
+    The row is picked with a plain read, so the update is retried if a
+    concurrent writer took a decremented row below zero first.  Without a
+    row to add to a new one is inserted; a concurrent insert just leaves
+    two rows, which readers sum.
+    """
+    from .models import PostArchiveBucket
+
+    month, status, category_id, author_id = key
+    buckets = PostArchiveBucket.objects.filter(
+        month=month, status=status, category_id=category_id, author_id=author_id,
+        count__gte=max(-delta, 0),
+    )
+    while True:
+        pk = buckets.order_by('pk').values_list('pk', flat=True).first()
+        if pk is None:
+            if delta > 0:
+                PostArchiveBucket.objects.create(
+                    month=month, status=status, category_id=category_id, author_id=author_id, count=delta,
+                )
+            # Nothing to take from: the bucket already drifted.
+            return
+        if PostArchiveBucket.objects.filter(pk=pk, count__gte=max(-delta, 0)).update(count=F('count') + delta):
+            return
+
+
+def move_post(before, after):
+    """Move a post from bucket ``before`` to ``after``; either may be None."""
+    if before == after:
+        return
+    if before is not None:
+        adjust_archive(before, -1)
+    if after is not None:
+        adjust_archive(after, 1)
+
+
+def uncategorize(category_id):
+    """Move the buckets of a category being deleted to 'no category', like its posts."""
+    from .models import PostArchiveBucket
+
+    for bucket in PostArchiveBucket.objects.filter(category_id=category_id, count__gt=0):
+        adjust_archive((bucket.month, bucket.status, None, bucket.author_id), bucket.count)
+    PostArchiveBucket.objects.filter(category_id=category_id).delete()
+
+
+def rebuild_archive():
+    """Recompute every bucket from the posts; returns the number of buckets."""
+    from .models import Post, PostArchiveBucket
+
+    rows = Post.objects.annotate(
+        month=TruncMonth(Coalesce('published_at', 'created_at')),
+    ).values('month', 'status', 'category_id', 'author_id').annotate(n=Count('pk')).order_by()
+    buckets = [
+        PostArchiveBucket(
+            month=timezone.localtime(row['month']).date(),
+            status=row['status'],
+            category_id=row['category_id'],
+            author_id=row['author_id'],
+            count=row['n'],
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        PostArchiveBucket.objects.all().delete()
+        PostArchiveBucket.objects.bulk_create(buckets)
+    return len(buckets)
+
+
+def month_range(year, month):
+    """Return the aware ``[start, end)`` datetimes of a month."""
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
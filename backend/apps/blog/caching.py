@@ -0,0 +1,154 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+from .conditional import make_etag, not_modified, set_validators
+
+KEY_PREFIX = 'response-cache'
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+class ResponseCache:
+    """Cache of serialized API responses invalidated by entity tags.
+
+    Each tag (``post:12``, ``category-list``, ...) has a version number in
+    the cache.  An entry remembers the versions of its tags when it was
+    stored and is only served while all of them are unchanged, so bumping
+    a tag invalidates every response that depends on it.  Entries also
+    expire after ``RESPONSE_CACHE_TIMEOUT`` seconds as a backstop for
+    writes that bypass signals (``QuerySet.update``).
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    def make_key(self, request, namespace):
+        params = urlencode(sorted(
+            (key, value) for key, values in request.query_params.lists() for value in values
+        ))
+        digest = hashlib.sha1(f'{request.path}?{params}'.encode()).hexdigest()
+        return f'{KEY_PREFIX}:{namespace}:{digest}'
+
+    def tag_versions(self, tags):
+        keys = {_tag_key(tag): tag for tag in tags}
+        current = cache.get_many(keys)
+        for key in keys.keys() - current.keys():
+            cache.add(key, time.time_ns(), None)
+            current[key] = cache.get(key)
+        return {keys[key]: version for key, version in current.items()}
+
+    def get(self, key):
+        entry = cache.get(key)
+        if entry is not None:
+            current = cache.get_many([_tag_key(tag) for tag in entry['tags']])
+            if all(current.get(_tag_key(tag)) == version for tag, version in entry['tags'].items()):
+                self._count('hits')
+                return entry
+        self._count('misses')
+        return None
+
+    def get_many(self, keys):
+        """Return ``{key: entry}`` for the keys with a still valid entry."""
+        entries = cache.get_many(keys)
+        tag_keys = {_tag_key(tag) for entry in entries.values() for tag in entry['tags']}
+        current = cache.get_many(list(tag_keys))
+        valid = {
+            key: entry for key, entry in entries.items()
+            if all(current.get(_tag_key(tag)) == version for tag, version in entry['tags'].items())
+        }
+        self._count('hits', len(valid))
+        self._count('misses', len(keys) - len(valid))
+        return valid
+
+    def set(self, key, data, versions, etag=None):
+        cache.set(key, {'data': data, 'tags': versions, 'etag': etag}, self.timeout)
+
+    def set_many(self, entries):
+        """Store ``{key: (data, versions)}`` entries."""
+        cache.set_many({
+            key: {'data': data, 'tags': versions, 'etag': None}
+            for key, (data, versions) in entries.items()
+        }, self.timeout)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            try:
+                cache.incr(_tag_key(tag))
+            except ValueError:
+                # Unknown tag: a fresh version can't collide with old entries.
+                cache.set(_tag_key(tag), time.time_ns(), None)
+
+    def invalidate_on_commit(self, *tags):
+        """Invalidate ``tags`` once the current transaction commits.
+
+        Invalidating earlier would let a concurrent reader cache the rows
+        as they were before the transaction.
+        """
+        transaction.on_commit(lambda: self.invalidate(*tags))
+
+    def stats(self):
+        counts = cache.get_many([f'{KEY_PREFIX}:hits', f'{KEY_PREFIX}:misses'])
+        return {
+            'hits': counts.get(f'{KEY_PREFIX}:hits', 0),
+            'misses': counts.get(f'{KEY_PREFIX}:misses', 0),
+        }
+
+    def _count(self, name, amount=1):
+        if not amount:
+            return
+        key = f'{KEY_PREFIX}:{name}'
+        if not cache.add(key, amount, None):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.set(key, amount, None)
+
+
+response_cache = ResponseCache()
+
+
+class CachedListMixin:
+    """Serve anonymous GET list responses from the tag-invalidated cache.
+
+    ``cache_tags`` names the collection tags the list always depends on;
+    ``get_cache_tags`` may add tags for the entities in the response.
+    """
+
+    cache_tags = ()
+
+    def get_cache_tags(self, data):
+        return set()
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        # The same URL renders differently per negotiated format.
+        key = response_cache.make_key(request, f'{type(self).__name__}:{request.accepted_renderer.format}')
+        entry = response_cache.get(key)
+        if entry is not None:
+            # The tag versions identify this representation, so they double
+            # as an ETag that is checked before anything is rendered.
+            response = not_modified(request, etag=entry['etag']) or Response(entry['data'])
+            patch_vary_headers(response, ['Accept'])
+            return set_validators(response, etag=entry['etag'])
+
+        # Snapshot collection versions first so a concurrent write during
+        # rendering leaves this entry already stale.
+        versions = response_cache.tag_versions(self.cache_tags)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            versions.update(response_cache.tag_versions(self.get_cache_tags(response.data)))
+            etag = make_etag(key, sorted(versions.items()))
+            response_cache.set(key, response.data, versions, etag)
+            set_validators(response, etag=etag)
+        return response
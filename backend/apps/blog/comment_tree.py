@@ -0,0 +1,30 @@
+from collections import deque
+
+
+def build_comment_tree(comments, max_depth=None):
+    """Assemble a flat list of comments into a tree in O(n).
+
+    Every comment gets a ``tree_replies`` list and a ``tree_depth`` (roots
+    are depth 0).  Replies deeper than ``max_depth`` are cut off.  Returns
+    the root comments in their original order.
+    """
+    comments = list(comments)
+    by_id = {comment.pk: comment for comment in comments}
+    roots = []
+    for comment in comments:
+        comment.tree_replies = []
+    for comment in comments:
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.tree_replies.append(comment)
+
+    queue = deque((root, 0) for root in roots)
+    while queue:
+        comment, depth = queue.popleft()
+        comment.tree_depth = depth
+        if max_depth is not None and depth >= max_depth:
+            comment.tree_replies = []
+        queue.extend((reply, depth + 1) for reply in comment.tree_replies)
+    return roots
@@ -0,0 +1,66 @@
+"""
+Normalized ("compact") list responses.
+
+Selected with ``?format=compact`` or ``Accept: application/vnd.chyrp.compact+json``.
+Rows reference related objects by id and every referenced object is
+serialized once, in a side table next to ``results``.
+"""
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class CompactJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.chyrp.compact+json'
+    format = 'compact'
+
+
+class CompactListMixin:
+    """List view mixin adding the compact representation.
+
+    The view's ``get_serializer_class`` should return a serializer with
+    relations as ids when ``is_compact()``; ``compact_side_tables`` maps a
+    side-table name to ``(relation, serializer_class, many)`` for the
+    objects to collect from the page.
+    """
+
+    compact_side_tables = {}
+
+    def is_compact(self):
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return renderer is not None and renderer.format == CompactJSONRenderer.format
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_compact():
+            response = super().list(request, *args, **kwargs)
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(page if page is not None else queryset)
+        data = self.get_serializer(objects, many=True).data
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response({'results': data})
+        response.data.update(self.get_side_tables(objects, data))
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def get_side_tables(self, objects, data):
+        # Only relations the rows actually reference (see ?fields=) get a table.
+        present = set(data[0]) if data else set()
+        context = {**self.get_serializer_context(), 'apply_fieldsets': False}
+        tables = {}
+        for name, (relation, serializer_class, many) in self.compact_side_tables.items():
+            if relation not in present:
+                continue
+            related = {}
+            for obj in objects:
+                values = getattr(obj, relation).all() if many else [getattr(obj, relation)]
+                for value in values:
+                    if value is not None:
+                        related.setdefault(value.pk, value)
+            tables[name] = serializer_class(list(related.values()), many=True, context=context).data
+        return tables
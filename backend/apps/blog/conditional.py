@@ -0,0 +1,80 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Build a weak ETag from the given validator parts.
+
+    Weak, because counters such as ``view_count`` may move without the
+    representation changing in any way clients care about.
+    """
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Return a 304 response if the request's validators still match, else None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer conditional GETs before the view does any serialization.
+
+    Subclasses implement ``get_validators`` returning ``(etag,
+    last_modified)``, computed from something cheaper than the response
+    itself.  ``on_not_modified`` runs when a 304 is returned instead.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def on_not_modified(self, request, *args, **kwargs):
+        pass
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            self.on_not_modified(request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    """Validators for list views from the newest ``updated_at``, row count
+    and the versions of ``version_tags``.
+
+    Newest timestamp and count alone miss a delete followed by an insert
+    of an older row, so writers of the listed rows also invalidate
+    ``version_tags`` in the response cache, whose versions only move on.
+    """
+
+    last_modified_field = 'updated_at'
+    version_tags = ()
+
+    def get_validators(self, request, *args, **kwargs):
+        from .caching import response_cache
+
+        versions = response_cache.tag_versions(self.version_tags)
+        state = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max(self.last_modified_field), count=Count('pk'),
+        )
+        etag = make_etag(request.get_full_path(), state['last_modified'], state['count'], sorted(versions.items()))
+        return etag, state['last_modified']
@@ -0,0 +1,215 @@
+import logging
+import random
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+
+from .caching import response_cache
+from .stats import invalidate_post_stats
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """Write-behind accumulator for post view counts.
+
+    Increments are collected in memory and written as atomic
+    ``F('view_count') + n`` updates.  A flush happens at the latest
+    ``flush_interval`` seconds after the first buffered increment, or
+    as soon as ``max_pending`` distinct posts are waiting, so the value
+    stored in the database is never staler than that interval.
+    """
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self.flush_interval = flush_interval or getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 5)
+        self.max_pending = max_pending or getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000)
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def increment(self, post_id, amount=1):
+        with self._lock:
+            self._pending[post_id] += amount
+            full = len(self._pending) >= self.max_pending
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def pending(self, post_id):
+        """Return the number of buffered, not yet flushed views for a post."""
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """Write all buffered increments; returns the number of views flushed."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        from .models import Post
+
+        # Posts that received the same number of views share one UPDATE.
+        by_amount = defaultdict(list)
+        for post_id, amount in pending.items():
+            by_amount[amount].append(post_id)
+
+        try:
+            with transaction.atomic():
+                for amount, post_ids in by_amount.items():
+                    Post.objects.filter(pk__in=post_ids).update(view_count=F('view_count') + amount)
+                invalidate_post_stats(pending)
+        except DatabaseError:
+            logger.exception('Failed to flush %d buffered post views', sum(pending.values()))
+            with self._lock:
+                self._pending.update(pending)
+                self._schedule()
+            return 0
+        return sum(pending.values())
+
+    def _schedule(self):
+        # Caller must hold self._lock.
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread owns its own connection; don't leak it.
+            connection.close()
+
+
+view_counter = ViewCountBuffer()
+
+
+def adjust_like_count(post, delta):
+    """Apply a like/unlike to ``post.like_count`` without counting rows.
+
+    Posts at or above ``LIKE_COUNTER_SHARD_THRESHOLD`` likes spread their
+    updates over ``LIKE_COUNTER_SHARDS`` rows so concurrent toggles don't
+    queue on the post row; ``fold_like_shards`` moves those deltas back
+    into ``like_count``.
+    """
+    from .models import LikeCounterShard, Post
+
+    shards = getattr(settings, 'LIKE_COUNTER_SHARDS', 0)
+    if shards > 1 and post.like_count >= getattr(settings, 'LIKE_COUNTER_SHARD_THRESHOLD', 1000):
+        shard = random.randrange(shards)
+        shard_rows = LikeCounterShard.objects.filter(post_id=post.pk, shard=shard)
+        if not shard_rows.update(delta=F('delta') + delta):
+            LikeCounterShard.objects.get_or_create(post_id=post.pk, shard=shard)
+            shard_rows.update(delta=F('delta') + delta)
+        return
+
+    if delta < 0:
+        Post.objects.filter(pk=post.pk, like_count__gte=-delta).update(like_count=F('like_count') + delta)
+    else:
+        Post.objects.filter(pk=post.pk).update(like_count=F('like_count') + delta)
+    invalidate_post_stats([post.pk])
+
+
+def adjust_comment_count(post_id, delta):
+    """Apply an approved comment appearing or disappearing to ``post.comment_count``."""
+    from .models import Post
+
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comment_count__gte=-delta)
+    posts.update(comment_count=F('comment_count') + delta)
+    # Lists and the detail show comment_count, so drop those with the stats.
+    invalidate_post_stats([post_id])
+    transaction.on_commit(lambda: response_cache.invalidate(f'post:{post_id}'))
+
+
+def fold_like_shards():
+    """Merge pending sharded like deltas into ``Post.like_count``."""
+    from .models import LikeCounterShard, Post
+
+    folded = 0
+    post_ids = LikeCounterShard.objects.exclude(delta=0).values_list('post_id', flat=True).distinct()
+    for post_id in post_ids:
+        with transaction.atomic():
+            shard_rows = LikeCounterShard.objects.select_for_update().filter(post_id=post_id)
+            total = sum(shard.delta for shard in shard_rows)
+            if total:
+                Post.objects.filter(pk=post_id).update(like_count=Greatest(F('like_count') + total, 0))
+                invalidate_post_stats([post_id])
+            shard_rows.update(delta=0)
+        folded += 1
+    return folded
+
+
+def reconcile_counter(field, related_model, related_filter=None, chunk_size=1000, shard_model=None):
+    """Recompute a denormalized Post counter from its source table.
+
+    Posts are walked in primary key chunks with one grouped aggregate per
+    chunk; only posts whose stored value drifted are updated.  Deltas
+    pending in ``shard_model`` rows count towards the stored value and
+    are zeroed when a post is corrected.  Returns the number of posts
+    corrected.
+    """
+    from .models import Post
+
+    related = related_model.objects.all()
+    if related_filter is not None:
+        related = related.filter(related_filter)
+
+    fixed = 0
+    last_pk = 0
+    while True:
+        chunk = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', field)[:chunk_size]
+        )
+        if not chunk:
+            return fixed
+        last_pk = chunk[-1][0]
+        pks = [pk for pk, _ in chunk]
+        actual = dict(
+            related.filter(post_id__in=pks)
+            .values('post_id').annotate(n=Count('pk')).values_list('post_id', 'n')
+        )
+        pending = {}
+        if shard_model is not None:
+            pending = dict(
+                shard_model.objects.filter(post_id__in=pks)
+                .values('post_id').annotate(total=Sum('delta')).values_list('post_id', 'total')
+            )
+        for pk, stored in chunk:
+            if actual.get(pk, 0) != stored + pending.get(pk, 0) and _reset_counter(pk, field, related, shard_model):
+                invalidate_post_stats([pk])
+                fixed += 1
+
+
+def _reset_counter(pk, field, related, shard_model):
+    """Recount one post's counter under lock; returns True if it was corrected.
+
+    The post row and its shards are locked first, so toggles committing
+    meanwhile either are counted here or apply their delta afterwards.
+    """
+    from .models import Post
+
+    with transaction.atomic():
+        stored = Post.objects.select_for_update().filter(pk=pk).values_list(field, flat=True).first()
+        if stored is None:
+            return False
+        shards = list(shard_model.objects.select_for_update().filter(post_id=pk)) if shard_model else []
+        count = related.filter(post_id=pk).count()
+        if count == stored + sum(shard.delta for shard in shards):
+            return False
+        Post.objects.filter(pk=pk).update(**{field: count})
+        if shards:
+            shard_model.objects.filter(pk__in=[shard.pk for shard in shards]).update(delta=0)
+    return True
@@ -0,0 +1,112 @@
+"""
+Sparse fieldsets: ``?fields=a,b`` keeps only the named top-level fields,
+``?exclude=c`` drops fields.  Serializers trim their output, and views
+trim their querysets to match: unrequested columns are deferred and
+unrequested relations are neither joined nor prefetched.
+"""
+from django.db.models import Prefetch
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def _param_set(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def sparse_field_names(names, request):
+    """Return the subset of ``names`` the request asks for, or None for all."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = _param_set(request, FIELDS_PARAM)
+    exclude = _param_set(request, EXCLUDE_PARAM)
+    if fields is None and exclude is None:
+        return None
+    keep = [name for name in names if fields is None or name in fields]
+    return [name for name in keep if not exclude or name not in exclude]
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin honouring ``?fields=`` and ``?exclude=``.
+
+    Only serializers built with a request in their context are trimmed, so
+    nested serializers declared on a parent class are left intact.  Pass
+    ``apply_fieldsets=False`` in the context to opt out explicitly.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('apply_fieldsets', True):
+            return
+        keep = sparse_field_names(list(self.fields), self.context.get('request'))
+        if keep is not None:
+            for name in set(self.fields) - set(keep):
+                self.fields.pop(name)
+
+
+def _flatten_select_related(tree, prefix=''):
+    lookups = []
+    for name, children in tree.items():
+        lookup = f'{prefix}{name}'
+        lookups.append(lookup)
+        lookups.extend(_flatten_select_related(children, f'{lookup}__'))
+    return lookups
+
+
+def _lookup_root(lookup):
+    if isinstance(lookup, Prefetch):
+        lookup = lookup.prefetch_through
+    return lookup.split('__', 1)[0]
+
+
+class SparseFieldsetViewMixin:
+    """View mixin pushing the requested fieldset down into the queryset.
+
+    ``sparse_required_fields`` lists model fields the view itself reads and
+    that must therefore never be deferred.
+    """
+
+    sparse_required_fields = ()
+
+    def get_sparse_required_fields(self):
+        return set(self.sparse_required_fields)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_serializer_class()().fields
+        keep = sparse_field_names(list(fields), self.request)
+        if keep is None:
+            return queryset
+
+        # Method fields (source '*') read the relation named like the field.
+        kept_roots = {
+            name if fields[name].source == '*' else fields[name].source.split('.', 1)[0]
+            for name in keep
+        }
+        kept_roots |= self.get_sparse_required_fields()
+
+        select_related = queryset.query.select_related
+        prefetch_related = queryset._prefetch_related_lookups
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if isinstance(select_related, dict):
+            joins = [
+                lookup for lookup in _flatten_select_related(select_related)
+                if _lookup_root(lookup) in kept_roots
+            ]
+            if joins:
+                queryset = queryset.select_related(*joins)
+        prefetches = [lookup for lookup in prefetch_related if _lookup_root(lookup) in kept_roots]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+
+        # Columns the response won't show, including ones the serializer
+        # never shows at all, are not loaded.
+        deferred = [
+            field.name for field in queryset.model._meta.concrete_fields
+            if field.name not in kept_roots and not field.primary_key
+        ]
+        return queryset.defer(*deferred) if deferred else queryset
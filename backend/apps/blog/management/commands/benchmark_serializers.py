@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.blog.fast_serializers import compile_serializer
+from apps.blog.serializers import PostCompactListSerializer, PostListSerializer
+from apps.blog.views import PostListView
+
+
+class Command(BaseCommand):
+    help = 'Time DRF against compiled rendering of a page of posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        posts = list(PostListView.queryset.order_by('-created_at', '-id')[:options['page_size']])
+        if not posts:
+            self.stdout.write('No posts to render.')
+            return
+        request = Request(APIRequestFactory().get('/api/blog/posts/'))
+        for serializer_class in (PostListSerializer, PostCompactListSerializer):
+            serializer = serializer_class(context={'request': request})
+            drf = self.time(options['rounds'], lambda: [
+                serializers.Serializer.to_representation(serializer, post) for post in posts
+            ])
+            render = compile_serializer(serializer)
+            compiled = self.time(options['rounds'], lambda: [render(post) for post in posts])
+            self.stdout.write(
+                f'{serializer_class.__name__}: {len(posts)} posts, DRF {drf * 1000:.2f} ms, '
+                f'compiled {compiled * 1000:.2f} ms ({drf / compiled:.1f}x)'
+            )
+
+    @staticmethod
+    def time(rounds, render):
+        """Return the best time of ``rounds`` renders, in seconds."""
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.spool import post_view_spool
+
+
+class Command(BaseCommand):
+    help = 'Load spooled PostView events into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recover', action='store_true',
+            help='Also replay segments left behind by crashed processes.',
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Only report spool depth and lag without loading anything.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            loaded = post_view_spool.load(recover=options['recover'])
+            self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} post views.'))
+
+        stats = post_view_spool.stats()
+        self.stdout.write(
+            f"Spool: {stats['segments']} segments, {stats['depth']} events pending, "
+            f"lag {stats['lag_seconds']:.1f}s"
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.analytics import prune_post_views
+
+
+class Command(BaseCommand):
+    help = 'Roll up and delete raw PostView rows older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=None,
+            help='Keep this many days of raw views (default: POST_VIEW_RETENTION_DAYS).',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        deleted = prune_post_views(options['retention_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} post views.'))
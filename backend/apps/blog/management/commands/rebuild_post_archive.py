@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.archive import rebuild_archive
+from apps.blog.caching import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Recompute the month/year archive counts from the posts.'
+
+    def handle(self, *args, **options):
+        buckets = rebuild_archive()
+        response_cache.invalidate('post-list')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} archive buckets.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.models import Post, RelatedPost
+from apps.blog.related import refresh_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related posts of every published post.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        RelatedPost.objects.exclude(post__status='published').delete()
+        post_ids = list(Post.objects.filter(status='published').order_by('pk').values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        for start in range(0, len(post_ids), chunk_size):
+            refresh_related_posts(post_ids[start:start + chunk_size])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt related posts for {len(post_ids)} posts.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.models import Post
+from apps.blog.search import index_post, search_vector, uses_postgres
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all posts.'
+
+    def handle(self, *args, **options):
+        if uses_postgres():
+            count = Post.objects.update(search_vector=search_vector())
+        else:
+            count = 0
+            for post in Post.objects.only('id', 'title', 'excerpt', 'content').iterator():
+                index_post(post)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} posts.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.blog.counters import reconcile_counter
+from apps.blog.models import Comment
+
+
+class Command(BaseCommand):
+    help = 'Repair Post.comment_count drift against the approved comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counter(
+            'comment_count', Comment, Q(is_approved=True), chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Corrected {fixed} comment counts.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.counters import fold_like_shards, reconcile_counter
+from apps.blog.models import Like, LikeCounterShard
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded like deltas and repair Post.like_count drift against the Like table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        folded = fold_like_shards()
+        fixed = reconcile_counter(
+            'like_count', Like, chunk_size=options['chunk_size'], shard_model=LikeCounterShard,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Folded like shards for {folded} posts, corrected {fixed} like counts.'
+        ))
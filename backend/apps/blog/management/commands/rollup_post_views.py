@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.blog.analytics import rebuild_day
+from apps.blog.models import PostView
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily PostView rollups from raw rows, e.g. to backfill existing views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD, default: oldest view).')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD, default: yesterday).')
+
+    def handle(self, *args, **options):
+        views = PostView.objects.all()
+        if options['start']:
+            views = views.filter(created_at__date__gte=self._parse(options['start']))
+        end = self._parse(options['end']) if options['end'] else timezone.localdate() - datetime.timedelta(days=1)
+
+        rebuilt = skipped = 0
+        for day in views.filter(created_at__date__lte=end).dates('created_at', 'day'):
+            if rebuild_day(day):
+                rebuilt += 1
+            else:
+                skipped += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rebuilt} days of rollups, skipped {skipped} already rolled up.'
+        ))
+
+    def _parse(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
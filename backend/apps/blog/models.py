@@ -1,8 +1,12 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
+from .search import SearchVectorIndex
+
 User = get_user_model()
 
 
@@ -56,6 +60,17 @@ class Post(models.Model):
         ('archived', 'Archived'),
     ]
     
+    # Which feather table holds the post body; maintained by apps.feathers.
+    FEATHER_CHOICES = [
+        ('text', 'Text'),
+        ('photo', 'Photo'),
+        ('quote', 'Quote'),
+        ('link', 'Link'),
+        ('video', 'Video'),
+        ('audio', 'Audio'),
+        ('uploader', 'Uploader'),
+    ]
+    
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     content = models.TextField()
@@ -65,6 +80,7 @@ class Post(models.Model):
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     featured_image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    featured_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     view_count = models.PositiveIntegerField(default=0)
     like_count = models.PositiveIntegerField(default=0)
     comment_count = models.PositiveIntegerField(default=0)
@@ -73,12 +89,21 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True)
+    feather_type = models.CharField(max_length=20, choices=FEATHER_CHOICES, blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Moved on by writers of what the detail shows from other rows: comments,
+    # tags, the category, authors and related posts.
+    detail_updated_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['status', 'created_at']),
+            # Serves both page-number listing and the (created_at, id) keyset seek.
+            models.Index(fields=['status', '-created_at', '-id'], name='blog_post_feed_idx'),
             models.Index(fields=['author', 'status']),
+            # Archive month listings.
+            models.Index(fields=['status', '-published_at', '-id'], name='blog_post_archive_idx'),
+            SearchVectorIndex(fields=['search_vector'], name='blog_post_search_idx'),
         ]
     
     def __str__(self):
@@ -88,16 +113,17 @@ class Post(models.Model):
         if not self.slug:
             self.slug = slugify(self.title)
         if self.status == 'published' and not self.published_at:
-            from django.utils import timezone
             self.published_at = timezone.now()
         super().save(*args, **kwargs)
     
     def get_absolute_url(self):
-        return reverse('post-detail', kwargs={'slug': self.slug})
+        return reverse('post-slug-detail', kwargs={'slug': self.slug})
     
     def increment_view_count(self):
-        self.view_count += 1
-        self.save(update_fields=['view_count'])
+        from .counters import view_counter
+        view_counter.increment(self.pk)
+        # Include views that are buffered but not yet written.
+        self.view_count += view_counter.pending(self.pk)
 
 
 class Comment(models.Model):
@@ -113,6 +139,9 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at']),
+        ]
     
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
@@ -132,6 +161,75 @@ class Like(models.Model):
         return f'{self.user.username} likes {self.post.title}'
 
 
+class LikeCounterShard(models.Model):
+    """Pending like-count deltas for heavily liked posts, spread over shards."""
+    
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='like_shards')
+    shard = models.PositiveSmallIntegerField()
+    delta = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['post', 'shard']
+    
+    def __str__(self):
+        return f'Like shard {self.shard} for {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    """Inverted search index used when the database has no full-text search."""
+    
+    TERM_MAX_LENGTH = 64
+    
+    term = models.CharField(max_length=TERM_MAX_LENGTH)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.FloatField()
+    
+    class Meta:
+        unique_together = ['term', 'post']
+    
+    def __str__(self):
+        return f'{self.term} in {self.post_id}'
+
+
+class RelatedPost(models.Model):
+    """Precomputed related posts of a post, rank 0 being the most similar."""
+    
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_posts')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['rank']
+        unique_together = ['post', 'rank']
+    
+    def __str__(self):
+        return f'{self.related_id} related to {self.post_id}'
+
+
+class PostArchiveBucket(models.Model):
+    """Number of posts per month, status, category and author.
+    
+    ``month`` is the first day of the month the post was published in, or
+    created in if it never was.
+    """
+    
+    month = models.DateField()
+    status = models.CharField(max_length=10, choices=Post.STATUS_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'month']),
+        ]
+    
+    def __str__(self):
+        return f'{self.count} {self.status} posts in {self.month:%Y-%m}'
+
+
 class PostView(models.Model):
     """Track post views for analytics."""
     
@@ -139,9 +237,53 @@ class PostView(models.Model):
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField(blank=True)
     referer = models.URLField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: spooled views are loaded later with their original time.
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         indexes = [
             models.Index(fields=['post', 'created_at']),
         ]
+
+
+class PostViewDaily(models.Model):
+    """Per-post, per-day rollup of PostView rows."""
+    
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    # Top referers as {referer: views}, trimmed to POST_VIEW_TOP_REFERERS.
+    referers = models.JSONField(default=dict)
+    # HyperLogLog sketch of the day's visitor IPs; unique_ips is its estimate.
+    visitor_sketch = models.BinaryField(default=b'', editable=False)
+    
+    class Meta:
+        unique_together = ['post', 'day']
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f'{self.views} views of {self.post_id} on {self.day}'
+
+
+class PostVisitorSketch(models.Model):
+    """All-time HyperLogLog sketch of a post's visitor IPs."""
+    
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='visitor_sketch')
+    sketch = models.BinaryField(default=b'', editable=False)
+    unique_visitors = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.unique_visitors} unique visitors of {self.post_id}'
+
+
+class PostViewRollupDay(models.Model):
+    """Days rebuilt from complete raw PostView rows, which may then be pruned."""
+    
+    day = models.DateField(unique=True)
+    rolled_up_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f'Rolled up {self.day}'
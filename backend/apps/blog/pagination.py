@@ -0,0 +1,165 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# Largest value of a bigint primary key.
+MAX_ID = 2 ** 63 - 1
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on ``(created_at, id)``.
+
+    Each page is fetched with a ``WHERE (created_at, id) < (...)`` seek
+    over the matching index instead of an OFFSET, no COUNT query is run,
+    and pages stay stable while new rows are inserted.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        reverse = cursor is not None and cursor['reverse']
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(cursor['key'], ordering))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        # Following a previous link means there is always a next page.
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.first_key = self._key(results[0]) if results else None
+        self.last_key = self._key(results[-1]) if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_key is None:
+            return None
+        return self.encode_cursor(self.last_key, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_key is None:
+            return None
+        return self.encode_cursor(self.first_key, reverse=True)
+
+    def encode_cursor(self, key, reverse):
+        payload = json.dumps({'k': key, 'r': reverse}, separators=(',', ':'))
+        cursor = b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            key = payload['k']
+            if len(key) != len(self.ordering) or parse_datetime(key[0]) is None:
+                raise ValueError
+            if type(key[1]) is not int or not 0 <= key[1] <= MAX_ID:
+                raise ValueError
+            return {'key': key, 'reverse': bool(payload['r'])}
+        except (TypeError, KeyError, ValueError, OverflowError, UnicodeError, BinasciiError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _key(self, obj):
+        created_at, pk = (getattr(obj, field.lstrip('-')) for field in self.ordering)
+        return [created_at.isoformat(), pk]
+
+    def _seek(self, key, ordering):
+        (time_field, id_field) = (field.lstrip('-') for field in ordering)
+        lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+        created_at, pk = parse_datetime(key[0]), key[1]
+        return (
+            Q(**{f'{time_field}__{lookup}': created_at})
+            | Q(**{time_field: created_at, f'{id_field}__{lookup}': pk})
+        )
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class FeedPagination(BasePagination):
+    """Page-number pagination by default, keyset pagination on request.
+
+    Clients opt into cursor mode with ``?pagination=cursor`` and then
+    follow the ``next``/``previous`` links, which carry ``?cursor=``.
+    """
+
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.keyset = KeysetPagination()
+        self.page_number = PageNumberPagination()
+        self.active = self.page_number
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.keyset.cursor_query_param in params or params.get(self.mode_query_param) == 'cursor':
+            self.active = self.keyset
+        else:
+            self.active = self.page_number
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number.get_paginated_response_schema(schema)
+
+
+class PublishedFeedPagination(FeedPagination):
+    """``FeedPagination`` for lists ordered by publication date."""
+
+    def __init__(self):
+        super().__init__()
+        self.keyset.ordering = ('-published_at', '-id')
@@ -0,0 +1,183 @@
+"""
+Related posts from tag and category overlap.
+
+Each published post's features are its tags and its category, weighted
+by inverse document frequency, so sharing a rare tag counts for more
+than sharing a common one.  Similarity is the weighted Jaccard index
+``sum(w, shared) / sum(w, either)``.  Candidates come from the tag and
+category indexes, at most ``RELATED_POSTS_CANDIDATES`` of each, and the
+best ``RELATED_POSTS_COUNT`` are stored as ``RelatedPost`` rows.
+
+Edits mark posts dirty in ``related_posts_refresher``; its timer thread
+recomputes them together with the posts whose lists they may enter or
+leave.
+"""
+import logging
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED = 'published'
+
+
+def _features(post_ids):
+    """Return ``{post_id: {feature}}`` with ``('t', tag_id)`` and ``('c', category_id)`` features."""
+    from .models import Post
+
+    features = defaultdict(set)
+    for post_id, tag_id in Post.tags.through.objects.filter(post_id__in=post_ids).values_list('post_id', 'tag_id'):
+        features[post_id].add(('t', tag_id))
+    for post_id, category_id in Post.objects.filter(pk__in=post_ids, category__isnull=False).values_list('pk', 'category_id'):
+        features[post_id].add(('c', category_id))
+    return features
+
+
+def _weights(features):
+    """Return the inverse document frequency of each feature among published posts."""
+    from .models import Post
+
+    published = Post.objects.filter(status=PUBLISHED)
+    total = published.count()
+    tag_ids = [value for kind, value in features if kind == 't']
+    category_ids = [value for kind, value in features if kind == 'c']
+    frequency = {}
+    for tag_id, count in Post.tags.through.objects.filter(
+        tag_id__in=tag_ids, post__status=PUBLISHED,
+    ).values('tag_id').annotate(n=Count('pk')).values_list('tag_id', 'n'):
+        frequency[('t', tag_id)] = count
+    for category_id, count in published.filter(category_id__in=category_ids).values(
+        'category_id',
+    ).annotate(n=Count('pk')).values_list('category_id', 'n'):
+        frequency[('c', category_id)] = count
+    return {feature: math.log(1 + total / frequency.get(feature, 1)) for feature in features}
+
+
+def _candidates(post_id, features, limit):
+    from .models import Post
+
+    published = Post.objects.filter(status=PUBLISHED).exclude(pk=post_id)
+    tag_ids = [value for kind, value in features if kind == 't']
+    category_ids = [value for kind, value in features if kind == 'c']
+    candidates = set()
+    if tag_ids:
+        candidates.update(
+            Post.tags.through.objects.filter(tag_id__in=tag_ids, post__in=published)
+            .values('post_id').annotate(shared=Count('tag_id')).order_by('-shared')
+            .values_list('post_id', flat=True)[:limit]
+        )
+    if category_ids:
+        candidates.update(
+            published.filter(category_id__in=category_ids).order_by('-created_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+    return candidates
+
+
+def similar_posts(post_id, count=None, candidate_limit=None):
+    """Return ``[(related_id, score)]`` for a post, most similar first."""
+    count = count or getattr(settings, 'RELATED_POSTS_COUNT', 5)
+    candidate_limit = candidate_limit or getattr(settings, 'RELATED_POSTS_CANDIDATES', 200)
+
+    own = _features([post_id]).get(post_id, set())
+    if not own:
+        return []
+    candidates = _candidates(post_id, own, candidate_limit)
+    features = _features(candidates)
+    weights = _weights(set().union(own, *features.values()))
+
+    scores = []
+    for candidate in candidates:
+        theirs = features.get(candidate, set())
+        union = sum(weights[feature] for feature in own | theirs)
+        shared = sum(weights[feature] for feature in own & theirs)
+        if shared:
+            scores.append((candidate, shared / union))
+    scores.sort(key=lambda item: (-item[1], -item[0]))
+    return scores[:count]
+
+
+def refresh_related_posts(post_ids):
+    """Recompute the related posts of ``post_ids``; returns the posts refreshed."""
+    from .models import Post, RelatedPost
+
+    published = set(Post.objects.filter(pk__in=post_ids, status=PUBLISHED).values_list('pk', flat=True))
+    for post_id in post_ids:
+        related = similar_posts(post_id) if post_id in published else []
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id=post_id).delete()
+            RelatedPost.objects.bulk_create([
+                RelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+                for rank, (related_id, score) in enumerate(related)
+            ])
+            Post.objects.filter(pk=post_id).update(detail_updated_at=timezone.now())
+    return len(post_ids)
+
+
+def affected_posts(post_ids):
+    """Return posts whose lists may change when ``post_ids`` change.
+
+    Those are the posts listing them now and, for published posts, their
+    new neighbours, which may now have room for them.
+    """
+    from .models import RelatedPost
+
+    affected = set(RelatedPost.objects.filter(related_id__in=post_ids).values_list('post_id', flat=True))
+    affected.update(RelatedPost.objects.filter(post_id__in=post_ids).values_list('related_id', flat=True))
+    return affected - set(post_ids)
+
+
+class RelatedPostsRefresher:
+    """Debounced background refresh of related posts for edited posts.
+
+    Marked posts are recomputed ``delay`` seconds after the first mark,
+    then so are the posts whose lists they may have entered or left.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = delay or getattr(settings, 'RELATED_POSTS_REFRESH_DELAY', 10)
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def mark(self, *post_ids):
+        with self._lock:
+            self._dirty.update(post_ids)
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Refresh every marked post and its neighbours; returns the posts refreshed."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not dirty:
+            return 0
+        try:
+            dirty = sorted(dirty)
+            refreshed = refresh_related_posts(dirty)
+            return refreshed + refresh_related_posts(sorted(affected_posts(dirty)))
+        except DatabaseError:
+            logger.exception('Failed to refresh related posts for %d posts', len(dirty))
+            return 0
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+related_posts_refresher = RelatedPostsRefresher()
@@ -0,0 +1,157 @@
+"""
+Full-text search over posts.
+
+On PostgreSQL posts carry a weighted ``tsvector`` (title A, excerpt B,
+content C) backed by a GIN index and are ranked with ``ts_rank``.  Other
+databases, e.g. SQLite test runs, use the ``SearchTerm`` inverted index
+maintained from Python with the same field weights.
+"""
+import math
+import re
+from collections import Counter
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection, transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.utils.html import escape
+
+SEARCH_CONFIG = 'english'
+
+# Same scale as PostgreSQL's default {D, C, B, A} weights.
+FIELD_WEIGHTS = {
+    'title': ('A', 1.0),
+    'excerpt': ('B', 0.4),
+    'content': ('C', 0.2),
+}
+
+HEADLINE_WORDS = 30
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it of on or that the this to was were will with'.split()
+)
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+class SearchVectorIndex(GinIndex):
+    """A GIN index on PostgreSQL and no index elsewhere.
+
+    Declared whatever database is configured, so the model state and
+    its migrations are the same on every backend.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().remove_sql(model, schema_editor, **kwargs)
+
+
+def tokenize(text):
+    """Split text into lowercase index terms."""
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def index_terms(text):
+    """Tokenize text into terms as stored in ``SearchTerm``, cut to its length."""
+    from .models import SearchTerm
+
+    return [token[:SearchTerm.TERM_MAX_LENGTH] for token in tokenize(text)]
+
+
+def search_vector():
+    vector = None
+    for field, (weight, _) in FIELD_WEIGHTS.items():
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def index_post(post):
+    """Refresh the search index entry for a single post."""
+    from .models import Post, SearchTerm
+
+    if uses_postgres():
+        Post.objects.filter(pk=post.pk).update(search_vector=search_vector())
+        return
+
+    scores = Counter()
+    for field, (_, weight) in FIELD_WEIGHTS.items():
+        for term, frequency in Counter(index_terms(getattr(post, field) or '')).items():
+            scores[term] += weight * (1 + math.log(frequency))
+
+    with transaction.atomic():
+        SearchTerm.objects.filter(post=post).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(post=post, term=term, weight=score)
+            for term, score in scores.items()
+        ], ignore_conflicts=True)
+
+
+def search_posts(queryset, query):
+    """Filter ``queryset`` to posts matching ``query``, best match first.
+
+    Results are annotated with ``search_rank`` and, on PostgreSQL, with a
+    ``search_headline`` snippet.
+    """
+    if uses_postgres():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank('search_vector', search_query),
+            search_headline=SearchHeadline(
+                'content', search_query, config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP,
+                max_words=HEADLINE_WORDS, min_words=HEADLINE_WORDS // 2,
+            ),
+        ).order_by('-search_rank', '-created_at')
+
+    from .models import SearchTerm
+
+    terms = set(index_terms(query))
+    if not terms:
+        return queryset.none()
+    matches = SearchTerm.objects.filter(post=OuterRef('pk'), term__in=terms).values('post')
+    return queryset.annotate(
+        search_matches=Subquery(
+            matches.annotate(n=Count('term')).values('n'), output_field=IntegerField()
+        ),
+        search_rank=Subquery(
+            matches.annotate(rank=Sum('weight')).values('rank'), output_field=FloatField()
+        ),
+    ).filter(search_matches=len(terms)).order_by('-search_rank', '-created_at')
+
+
+def highlight(text, query, max_words=HEADLINE_WORDS):
+    """Return an HTML-escaped snippet of ``text`` around the first query match."""
+    terms = set(tokenize(query))
+    words = text.split()
+    if not words:
+        return ''
+
+    def matches(word):
+        return any(token in terms for token in tokenize(word))
+
+    first = next((i for i, word in enumerate(words) if matches(word)), 0)
+    start = max(0, first - max_words // 3)
+    snippet = []
+    for word in words[start:start + max_words]:
+        if matches(word):
+            snippet.append(f'{HIGHLIGHT_START}{escape(word)}{HIGHLIGHT_STOP}')
+        else:
+            snippet.append(escape(word))
+    return ' '.join(snippet)
@@ -1,11 +1,17 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Post, Category, Tag, Comment, Like, PostView
+from apps.media.serializers import SrcsetField
+from .comment_tree import build_comment_tree
+from .fast_serializers import CompiledListSerializer, CompiledSerializerMixin
+from .fieldsets import SparseFieldsetMixin
+from .models import Post, Category, Tag, Comment, Like, PostView, RelatedPost
+from .search import highlight
 
 User = get_user_model()
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Category model."""
     
     class Meta:
@@ -13,7 +19,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'color', 'created_at']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Tag model."""
     
     class Meta:
@@ -24,9 +30,11 @@ class TagSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     """Simple user serializer for post display."""
     
+    avatar_srcset = SrcsetField('avatar')
+    
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'avatar']
+        fields = ['id', 'username', 'first_name', 'last_name', 'avatar', 'avatar_srcset']
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -41,39 +49,112 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'created_at', 'updated_at']
     
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True).data
-        return []
+        # Comments assembled by build_comment_tree carry their replies already.
+        replies = getattr(obj, 'tree_replies', None)
+        if replies is None:
+            replies = obj.replies.all()
+        return CommentSerializer(replies, many=True, context=self.context).data
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsetMixin, CompiledSerializerMixin, serializers.ModelSerializer):
     """Serializer for Post list view."""
     
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    featured_image_srcset = SrcsetField('featured_image')
     
     class Meta:
         model = Post
+        list_serializer_class = CompiledListSerializer
         fields = ['id', 'title', 'slug', 'excerpt', 'author', 'category', 'tags', 
-                 'status', 'featured_image', 'view_count', 'like_count', 'comment_count',
+                 'status', 'featured_image', 'featured_image_srcset', 'view_count', 'like_count', 'comment_count',
                  'is_featured', 'created_at', 'updated_at', 'published_at']
 
 
-class PostDetailSerializer(serializers.ModelSerializer):
+class PostCompactListSerializer(PostListSerializer):
+    """Serializer for compact Post lists, with related objects as ids."""
+    
+    author = serializers.PrimaryKeyRelatedField(read_only=True)
+    category = serializers.PrimaryKeyRelatedField(read_only=True)
+    tags = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+
+class PostSearchResultSerializer(PostListSerializer):
+    """Serializer for Post search results, with relevance and a snippet."""
+    
+    search_rank = serializers.FloatField(read_only=True)
+    search_headline = serializers.SerializerMethodField()
+    
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ['search_rank', 'search_headline']
+    
+    def get_search_headline(self, obj):
+        headline = getattr(obj, 'search_headline', None)
+        if headline is None:
+            headline = highlight(obj.content, self.context['request'].query_params.get('search', ''))
+        return headline
+
+
+class RelatedPostSerializer(serializers.ModelSerializer):
+    """Serializer for a precomputed related post."""
+    
+    id = serializers.IntegerField(source='related.id', read_only=True)
+    title = serializers.CharField(source='related.title', read_only=True)
+    slug = serializers.SlugField(source='related.slug', read_only=True)
+    excerpt = serializers.CharField(source='related.excerpt', read_only=True)
+    
+    class Meta:
+        model = RelatedPost
+        fields = ['id', 'title', 'slug', 'excerpt', 'score']
+
+
+class ArchiveTreeSerializer(serializers.ListSerializer):
+    """Nests month rows, newest first, under their years."""
+    
+    def to_representation(self, data):
+        years = []
+        for row in super().to_representation(data):
+            if not years or years[-1]['year'] != row['year']:
+                years.append({'year': row['year'], 'count': 0, 'months': []})
+            years[-1]['count'] += row['count']
+            years[-1]['months'].append({'month': row['month'], 'count': row['count']})
+        return years
+
+
+class ArchiveMonthSerializer(serializers.Serializer):
+    """Serializer for the number of published posts in a month."""
+    
+    year = serializers.IntegerField(source='month.year')
+    month = serializers.IntegerField(source='month.month')
+    count = serializers.IntegerField()
+    
+    class Meta:
+        list_serializer_class = ArchiveTreeSerializer
+
+
+class PostDetailSerializer(SparseFieldsetMixin, CompiledSerializerMixin, serializers.ModelSerializer):
     """Serializer for Post detail view."""
     
     author = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
+    related_posts = RelatedPostSerializer(many=True, read_only=True)
+    featured_image_srcset = SrcsetField('featured_image')
     
     class Meta:
         model = Post
+        list_serializer_class = CompiledListSerializer
         fields = ['id', 'title', 'slug', 'content', 'excerpt', 'author', 'category', 'tags',
-                 'status', 'featured_image', 'view_count', 'like_count', 'comment_count',
-                 'is_featured', 'allow_comments', 'created_at', 'updated_at', 'published_at',
-                 'comments']
+                 'status', 'featured_image', 'featured_image_srcset', 'view_count', 'like_count',
+                 'comment_count', 'is_featured', 'allow_comments', 'created_at', 'updated_at', 'published_at',
+                 'comments', 'related_posts']
+    
+    def get_comments(self, obj):
+        comments = list(obj.comments.all())
+        build_comment_tree(comments, max_depth=settings.COMMENT_MAX_DEPTH)
+        return CommentSerializer(comments, many=True, context=self.context).data
 
 
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
@@ -98,7 +179,8 @@ class CommentCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
-        validated_data['post'] = self.context['post']
+        # CommentListView passes the post to save(); otherwise take it from the context.
+        validated_data.setdefault('post', self.context.get('post'))
         return super().create(validated_data)
 
 
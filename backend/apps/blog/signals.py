@@ -0,0 +1,264 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .archive import ARCHIVE_FIELDS, archive_key, bucket_of, move_post, uncategorize
+from .caching import response_cache
+from .counters import adjust_comment_count
+from .models import Category, Comment, Post, RelatedPost, Tag
+from .related import related_posts_refresher
+from .search import FIELD_WEIGHTS, index_post
+from .slugs import post_slugs
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+def update_post_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in step with the searchable post fields."""
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_responses(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f'post:{instance.pk}', 'post-list')
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tag_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Posts were added to or removed from a tag.
+        post_ids = pk_set or instance.posts.values_list('pk', flat=True)
+    else:
+        post_ids = [instance.pk]
+    response_cache.invalidate_on_commit('post-list', *(f'post:{pk}' for pk in post_ids))
+
+
+def touch_details(posts):
+    """Move the detail validator of ``posts``, whose shown rows elsewhere changed."""
+    posts.update(detail_updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def touch_details_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        touch_details(Post.objects.filter(pk__in=pk_set) if pk_set is not None else instance.posts.all())
+    else:
+        touch_details(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tagged_details(sender, instance, **kwargs):
+    touch_details(Post.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_categorized_details(sender, instance, **kwargs):
+    touch_details(Post.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=User)
+def touch_authored_details(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    touch_details(Post.objects.filter(author=instance))
+    touch_details(Post.objects.filter(comments__author=instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(pre_delete, sender=Comment)
+def touch_commented_details(sender, instance, **kwargs):
+    touch_details(Post.objects.filter(pk=instance.post_id))
+
+
+# What related post lists show of a post.
+RELATED_SHOWN_FIELDS = {'title', 'slug', 'excerpt'}
+
+
+@receiver(post_save, sender=Post)
+def touch_listing_details(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and not set(update_fields) & RELATED_SHOWN_FIELDS:
+        return
+    touch_details(Post.objects.filter(related_posts__related=instance))
+
+
+# Fields that affect related posts: the features and what lists show.
+RELATED_POST_FIELDS = {'title', 'slug', 'category', 'status'}
+
+
+def _refresh_related_posts(post_ids):
+    post_ids = list(post_ids)
+    if post_ids:
+        transaction.on_commit(lambda: related_posts_refresher.mark(*post_ids))
+
+
+@receiver(post_save, sender=Post)
+def refresh_related_posts_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & RELATED_POST_FIELDS:
+        return
+    _refresh_related_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_related_posts_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        post_ids = pk_set or instance.posts.values_list('pk', flat=True)
+    else:
+        post_ids = [instance.pk]
+    _refresh_related_posts(post_ids)
+
+
+@receiver(pre_delete, sender=Post)
+def refresh_related_posts_on_delete(sender, instance, **kwargs):
+    # Rows pointing at the post cascade away; the lists they were in get refilled.
+    _refresh_related_posts(RelatedPost.objects.filter(related=instance).values_list('post_id', flat=True))
+    touch_details(Post.objects.filter(related_posts__related=instance))
+
+
+# Stands for a counted post that can't be told from the loaded fields.
+UNKNOWN = object()
+
+
+def _counted_post(comment):
+    """Return the post a comment currently counts towards, or None if unapproved.
+
+    Returns UNKNOWN if ``is_approved`` or ``post_id`` is deferred.
+    """
+    # Read from __dict__ so deferred fields are not loaded just for this.
+    values = comment.__dict__
+    if 'is_approved' not in values or 'post_id' not in values:
+        return UNKNOWN
+    return values['post_id'] if values['is_approved'] else None
+
+
+def _stored_counted_post(pk):
+    stored = Comment.objects.filter(pk=pk).values('is_approved', 'post_id').first()
+    return stored and (stored['post_id'] if stored['is_approved'] else None)
+
+
+def _load_counted_post(comment):
+    """Fill in the stored counted post of a comment loaded with deferred fields."""
+    if comment._counted_post_id is UNKNOWN and comment.pk is not None:
+        comment._counted_post_id = _stored_counted_post(comment.pk)
+
+
+@receiver(post_init, sender=Comment)
+def remember_comment_count_state(sender, instance, **kwargs):
+    instance._counted_post_id = _counted_post(instance)
+
+
+@receiver(pre_save, sender=Comment)
+def load_comment_count_state(sender, instance, **kwargs):
+    _load_counted_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_count_on_save(sender, instance, created, **kwargs):
+    """Keep Post.comment_count equal to the number of approved comments."""
+    before = None if created else instance._counted_post_id
+    after = _counted_post(instance)
+    if after is UNKNOWN:
+        after = _stored_counted_post(instance.pk)
+    if before != after:
+        if before is not None:
+            adjust_comment_count(before, -1)
+        if after is not None:
+            adjust_comment_count(after, 1)
+    instance._counted_post_id = after
+
+
+@receiver(pre_delete, sender=Comment)
+def load_comment_count_state_on_delete(sender, instance, **kwargs):
+    _load_counted_post(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def update_comment_count_on_delete(sender, instance, **kwargs):
+    if instance._counted_post_id is not None:
+        adjust_comment_count(instance._counted_post_id, -1)
+
+
+@receiver(post_init, sender=Post)
+def remember_slug(sender, instance, **kwargs):
+    instance._stored_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Post)
+def update_slug_cache(sender, instance, created, **kwargs):
+    slug = instance.__dict__.get('slug')
+    if slug is None:
+        return
+    if not created and instance._stored_slug not in (None, slug):
+        post_slugs.forget(instance._stored_slug)
+    instance._stored_slug = slug
+
+
+@receiver(post_delete, sender=Post)
+def forget_slug(sender, instance, **kwargs):
+    post_slugs.forget(*filter(None, [instance._stored_slug, instance.__dict__.get('slug')]))
+
+
+@receiver(post_init, sender=Post)
+def remember_archive_bucket(sender, instance, **kwargs):
+    instance._archive_key = archive_key(instance)
+
+
+@receiver(pre_save, sender=Post)
+def load_archive_bucket(sender, instance, **kwargs):
+    # Instances loaded with deferred fields didn't know their bucket.
+    if instance._archive_key is None and instance.pk is not None:
+        stored = Post.objects.filter(pk=instance.pk).values(*ARCHIVE_FIELDS).first()
+        if stored is not None:
+            instance._archive_stored = stored
+            instance._archive_key = bucket_of(stored)
+
+
+@receiver(post_save, sender=Post)
+def update_archive_on_save(sender, instance, created, **kwargs):
+    before = None if created else instance._archive_key
+    # Deferred fields aren't saved, so they still hold the stored values.
+    after = archive_key(instance, getattr(instance, '_archive_stored', None))
+    move_post(before, after)
+    instance._archive_key = after
+
+
+@receiver(post_delete, sender=Post)
+def update_archive_on_delete(sender, instance, **kwargs):
+    move_post(instance._archive_key, None)
+
+
+@receiver(pre_delete, sender=Category)
+def uncategorize_archive(sender, instance, **kwargs):
+    # Its posts are uncategorized with a bulk update, which sends no signals.
+    uncategorize(instance.pk)
+    response_cache.invalidate_on_commit('post-list')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f'category:{instance.pk}', 'category-list')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f'tag:{instance.pk}', 'tag-list')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit(f'author:{instance.pk}')
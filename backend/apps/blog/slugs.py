@@ -0,0 +1,58 @@
+"""
+In-process slug to post id resolution.
+
+Slug-addressed post pages resolve their slug here and then load the
+post by primary key.  Misses are answered from the unique slug index and
+remembered, up to ``POST_SLUG_CACHE_SIZE`` slugs, least recently used
+first out.  Post signals forget a slug when it changes or its post is
+deleted; other processes only learn of that when a cached id no longer
+matches, so callers must treat a cached id as a hint and ``forget`` the
+slug when the post it points to doesn't have it any more.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class SlugCache:
+    """Bounded, thread-safe ``{slug: post_id}`` cache."""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, 'POST_SLUG_CACHE_SIZE', 10000)
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, slug):
+        """Return ``(post_id, cached)`` for a slug; ``post_id`` is None if no post has it."""
+        with self._lock:
+            post_id = self._ids.get(slug)
+            if post_id is not None:
+                self._ids.move_to_end(slug)
+                return post_id, True
+
+        from .models import Post
+
+        post_id = Post.objects.filter(slug=slug).values_list('pk', flat=True).first()
+        if post_id is not None:
+            self.remember(slug, post_id)
+        return post_id, False
+
+    def remember(self, slug, post_id):
+        with self._lock:
+            self._ids[slug] = post_id
+            self._ids.move_to_end(slug)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def forget(self, *slugs):
+        with self._lock:
+            for slug in slugs:
+                self._ids.pop(slug, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+post_slugs = SlugCache()
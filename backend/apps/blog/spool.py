@@ -0,0 +1,232 @@
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import record_views
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+READY_SUFFIX = '.seg'
+LOADING_SUFFIX = '.loading'
+# Segments holding events that can't be loaded, kept for inspection.
+BAD_SUFFIX = '.bad'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_events(path):
+    events = []
+    with path.open() as handle:
+        for line in handle:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crashed writer.
+                logger.warning('Skipping malformed event in spool segment %s', path.name)
+    return events
+
+
+class MalformedEvent(ValueError):
+    pass
+
+
+def _decode_event(event):
+    """Return the PostView field values of a spooled event.
+
+    Raises MalformedEvent for events this version can't have written.
+    """
+    try:
+        values = {
+            'post_id': int(event['post_id']),
+            'ip_address': str(ipaddress.ip_address(event['ip_address'])),
+            'user_agent': str(event.get('user_agent') or ''),
+            'referer': str(event.get('referer') or ''),
+            'created_at': parse_datetime(event['created_at']),
+        }
+    except (KeyError, TypeError, ValueError) as exc:
+        raise MalformedEvent(f'Malformed post view event {event!r}') from exc
+    if values['created_at'] is None:
+        raise MalformedEvent(f'Malformed post view event {event!r}')
+    return values
+
+
+class PostViewSpool:
+    """Append-only on-disk spool for PostView events.
+
+    Each process appends one JSON line per view to its own open segment
+    file.  Segments are sealed once they reach ``segment_size`` events or
+    ``flush_interval`` seconds after the first event, and sealed segments
+    are loaded with ``bulk_create``.  Delivery is at-least-once: a crash
+    between committing a segment and unlinking it replays that segment.
+    A segment with an event that can't be decoded is renamed to ``.bad``
+    and left for inspection.
+    """
+
+    def __init__(self, directory=None, segment_size=None, flush_interval=None, batch_size=None):
+        self.directory = Path(directory or getattr(settings, 'POST_VIEW_SPOOL_DIR', settings.BASE_DIR / 'var' / 'spool'))
+        self.segment_size = segment_size or getattr(settings, 'POST_VIEW_SPOOL_SEGMENT_SIZE', 1000)
+        self.flush_interval = flush_interval or getattr(settings, 'POST_VIEW_SPOOL_FLUSH_INTERVAL', 10)
+        self.batch_size = batch_size or getattr(settings, 'POST_VIEW_SPOOL_BATCH_SIZE', 500)
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_path = None
+        self._segment_events = 0
+        self._timer = None
+
+    def append(self, post_id, ip_address, user_agent='', referer=''):
+        event = {
+            'post_id': post_id,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'referer': referer,
+            'created_at': timezone.now().isoformat(),
+        }
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(line)
+            self._segment_events += 1
+            if self._segment_events >= self.segment_size:
+                self._seal_segment()
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Seal the current segment and load every sealed segment."""
+        with self._lock:
+            if self._segment is not None:
+                self._seal_segment()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return self.load()
+
+    def load(self, recover=False):
+        """Load sealed segments into PostView; returns the number of events loaded.
+
+        With ``recover`` set, segments left open or half-loaded by processes
+        that no longer exist are loaded as well.
+        """
+        if recover:
+            self._recover_orphans()
+        loaded = 0
+        for path in self._segments(READY_SUFFIX):
+            claimed = path.with_name(f'{path.stem}-{os.getpid()}{LOADING_SUFFIX}')
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                # Another loader claimed it first.
+                continue
+            try:
+                loaded += self._load_segment(claimed)
+            except MalformedEvent:
+                logger.exception('Quarantined post view spool segment %s', claimed.name)
+                claimed.rename(path.with_suffix(BAD_SUFFIX))
+                continue
+            except DatabaseError:
+                logger.exception('Failed to load post view spool segment %s', claimed.name)
+                claimed.rename(path)
+                break
+            claimed.unlink()
+        return loaded
+
+    def stats(self):
+        """Return spool depth (unloaded events) and lag (age of the oldest one)."""
+        segments = 0
+        depth = 0
+        oldest = None
+        for path in self._segments(OPEN_SUFFIX, READY_SUFFIX, LOADING_SUFFIX):
+            try:
+                events = _read_events(path)
+            except FileNotFoundError:
+                continue
+            segments += 1
+            depth += len(events)
+            if events:
+                created_at = parse_datetime(events[0]['created_at'])
+                if oldest is None or created_at < oldest:
+                    oldest = created_at
+        return {
+            'segments': segments,
+            'depth': depth,
+            'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+        }
+
+    def _segments(self, *suffixes):
+        if not self.directory.exists():
+            return []
+        return sorted(path for path in self.directory.iterdir() if path.suffix in suffixes)
+
+    def _open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment_path = self.directory / f'{time.time_ns():020d}-{os.getpid()}{OPEN_SUFFIX}'
+        self._segment = self._segment_path.open('a', buffering=1)
+        self._segment_events = 0
+
+    def _seal_segment(self):
+        self._segment.close()
+        self._segment_path.rename(self._segment_path.with_suffix(READY_SUFFIX))
+        self._segment = None
+        self._segment_path = None
+        self._segment_events = 0
+
+    def _recover_orphans(self):
+        for path in self._segments(OPEN_SUFFIX, LOADING_SUFFIX):
+            pid = int(path.stem.rsplit('-', 1)[1])
+            if pid == os.getpid() or _pid_alive(pid):
+                continue
+            stem = path.stem if path.suffix == OPEN_SUFFIX else path.stem.rsplit('-', 1)[0]
+            try:
+                path.rename(path.with_name(stem + READY_SUFFIX))
+            except FileNotFoundError:
+                continue
+
+    def _load_segment(self, path):
+        from .models import Post, PostView
+
+        events = [_decode_event(event) for event in _read_events(path)]
+        # Views of posts deleted since they were spooled are dropped.
+        post_ids = set(Post.objects.filter(
+            pk__in={event['post_id'] for event in events}
+        ).values_list('pk', flat=True))
+        events = [event for event in events if event['post_id'] in post_ids]
+        with transaction.atomic():
+            for start in range(0, len(events), self.batch_size):
+                views = PostView.objects.bulk_create([
+                    PostView(**event) for event in events[start:start + self.batch_size]
+                ])
+                # Rollups commit or roll back together with the raw rows.
+                record_views(views)
+        return len(events)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+post_view_spool = PostViewSpool()
@@ -0,0 +1,67 @@
+"""
+Post counters served by the stats endpoints.
+
+Stats are cached per post in the response cache, tagged ``post:<id>``
+(invalidated by post saves and deletes) and ``post-stats:<id>``.  Counter
+writes that bypass model signals, i.e. the ``F()`` updates of view and
+like counts and visitor sketch merges, call ``invalidate_post_stats``.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from .caching import KEY_PREFIX, response_cache
+from .hll import HyperLogLog
+
+STATS_FIELDS = ('view_count', 'like_count', 'comment_count')
+
+
+def _stats_key(post_id):
+    return f'{KEY_PREFIX}:post-stats:{post_id}'
+
+
+def _stats_tags(post_id):
+    return (f'post:{post_id}', f'post-stats:{post_id}')
+
+
+def max_stats_ids():
+    return getattr(settings, 'POST_STATS_MAX_IDS', 100)
+
+
+def invalidate_post_stats(post_ids):
+    """Drop cached stats of ``post_ids`` once the current transaction commits."""
+    tags = [f'post-stats:{post_id}' for post_id in post_ids]
+    if tags:
+        transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+def get_post_stats(post_ids):
+    """Return ``{post_id: stats}`` for the existing posts among ``post_ids``.
+
+    Cached stats are read in one ``get_many``; the rest are loaded with a
+    single query and cached.
+    """
+    from .models import Post
+
+    keys = {_stats_key(post_id): post_id for post_id in post_ids}
+    stats = {keys[key]: entry['data'] for key, entry in response_cache.get_many(list(keys)).items()}
+    missing = [post_id for post_id in post_ids if post_id not in stats]
+    if not missing:
+        return stats
+
+    # Snapshot tag versions before reading so a concurrent write leaves
+    # the new entries already stale.
+    versions = response_cache.tag_versions([tag for post_id in missing for tag in _stats_tags(post_id)])
+    rows = Post.objects.filter(pk__in=missing).annotate(
+        unique_visitors=Coalesce('visitor_sketch__unique_visitors', 0),
+    ).values('pk', *STATS_FIELDS, 'unique_visitors')
+    error = round(HyperLogLog().relative_error, 4)
+    entries = {}
+    for row in rows:
+        post_id = row.pop('pk')
+        # HyperLogLog estimate; unique_visitors_error is its relative standard error.
+        row['unique_visitors_error'] = error
+        stats[post_id] = row
+        entries[_stats_key(post_id)] = (row, {tag: versions[tag] for tag in _stats_tags(post_id)})
+    response_cache.set_many(entries)
+    return stats
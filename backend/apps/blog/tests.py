@@ -0,0 +1,67 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .fast_serializers import compile_serializer
+from .models import Category, Comment, Post, Tag
+from .serializers import PostCompactListSerializer, PostDetailSerializer, PostListSerializer
+
+User = get_user_model()
+
+
+class CompiledSerializerContractTests(TestCase):
+    """Compiled serializers must render exactly what DRF renders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer', first_name='Ada')
+        cls.category = Category.objects.create(name='News')
+        cls.tags = [Tag.objects.create(name='django'), Tag.objects.create(name='python')]
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/api/blog/posts/'))
+
+    def create_post(self, **kwargs):
+        kwargs.setdefault('title', 'Hello')
+        kwargs.setdefault('content', 'Body')
+        kwargs.setdefault('status', 'published')
+        return Post.objects.create(author=self.author, **kwargs)
+
+    def assertRendersLikeDrf(self, serializer_class, post):
+        serializer = serializer_class(context={'request': self.request})
+        compiled = compile_serializer(serializer)(post)
+        expected = serializers.Serializer.to_representation(serializer, post)
+        self.assertEqual(JSONRenderer().render(compiled), JSONRenderer().render(expected))
+
+    def test_post_with_everything(self):
+        post = self.create_post(category=self.category, featured_image='posts/cover.jpg')
+        post.tags.set(self.tags)
+        Comment.objects.create(post=post, author=self.author, content='First')
+        for serializer_class in (PostListSerializer, PostCompactListSerializer, PostDetailSerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertRendersLikeDrf(serializer_class, Post.objects.get(pk=post.pk))
+
+    def test_null_featured_image(self):
+        post = self.create_post(category=None)
+        for serializer_class in (PostListSerializer, PostDetailSerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertRendersLikeDrf(serializer_class, Post.objects.get(pk=post.pk))
+
+    def test_naive_datetime(self):
+        post = Post.objects.get(pk=self.create_post().pk)
+        # As left on an instance by code assigning a naive value.
+        post.published_at = datetime.datetime(2024, 1, 31, 23, 30)
+        for serializer_class in (PostListSerializer, PostDetailSerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertRendersLikeDrf(serializer_class, post)
+
+    def test_empty_tag_list(self):
+        post = self.create_post(status='draft')
+        for serializer_class in (PostListSerializer, PostCompactListSerializer, PostDetailSerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertRendersLikeDrf(serializer_class, Post.objects.get(pk=post.pk))
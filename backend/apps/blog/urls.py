@@ -3,10 +3,16 @@ from . import views
 
 urlpatterns = [
     path('posts/', views.PostListView.as_view(), name='post-list'),
+    path('posts/stats/', views.post_stats_batch, name='post-stats-batch'),
     path('posts/<int:pk>/', views.PostDetailView.as_view(), name='post-detail'),
+    path('posts/by-slug/<slug:slug>/', views.PostSlugDetailView.as_view(), name='post-slug-detail'),
     path('posts/<int:post_id>/like/', views.toggle_like, name='post-like'),
     path('posts/<int:post_id>/stats/', views.post_stats, name='post-stats'),
+    path('posts/<int:post_id>/analytics/', views.post_analytics, name='post-analytics'),
     path('posts/<int:post_id>/comments/', views.CommentListView.as_view(), name='comment-list'),
+    path('archive/', views.PostArchiveView.as_view(), name='post-archive'),
+    path('archive/<int:year>/<int:month>/', views.ArchiveMonthPostListView.as_view(), name='post-archive-month'),
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('tags/', views.TagListView.as_view(), name='tag-list'),
+    path('cache/stats/', views.response_cache_stats, name='response-cache-stats'),
 ]
@@ -1,26 +1,86 @@
+from datetime import timedelta
+
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from django.db.models import Q, Count
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Post, Category, Tag, Comment, Like, PostView
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import analytics
+from .archive import month_range
+from .caching import CachedListMixin, response_cache
+from .comment_tree import build_comment_tree
+from .compact import CompactJSONRenderer, CompactListMixin
+from .conditional import ConditionalGetMixin, make_etag, not_modified, set_validators
+from .counters import adjust_like_count, view_counter
+from .fieldsets import SparseFieldsetViewMixin
+from .models import Post, Category, Tag, Comment, Like, RelatedPost, PostArchiveBucket
+from .pagination import FeedPagination, PublishedFeedPagination
+from .search import search_posts
+from .slugs import post_slugs
+from .spool import post_view_spool
+from .stats import get_post_stats, max_stats_ids
 from .serializers import (
-    PostListSerializer, PostDetailSerializer, PostCreateUpdateSerializer,
-    CategorySerializer, TagSerializer, CommentSerializer, CommentCreateSerializer,
-    LikeSerializer
+    ArchiveMonthSerializer, PostListSerializer, PostCompactListSerializer, PostSearchResultSerializer, PostDetailSerializer,
+    PostCreateUpdateSerializer, CategorySerializer, TagSerializer, UserSerializer, CommentSerializer,
+    CommentCreateSerializer, LikeSerializer
 )
 
 
-class PostListView(generics.ListCreateAPIView):
+class PostListView(SparseFieldsetViewMixin, CachedListMixin, CompactListMixin, generics.ListCreateAPIView):
     """List and create blog posts."""
     
     queryset = Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('tags')
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = FeedPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CompactJSONRenderer]
+    compact_side_tables = {
+        'authors': ('author', UserSerializer, False),
+        'categories': ('category', CategorySerializer, False),
+        'tags': ('tags', TagSerializer, True),
+    }
+    cache_tags = ['post-list']
+    # Read by keyset pagination.
+    sparse_required_fields = ['id', 'created_at']
+    
+    def get_sparse_required_fields(self):
+        required = super().get_sparse_required_fields()
+        if self.request.query_params.get('search'):
+            # Needed for the search snippet on databases without ts_headline.
+            required.add('content')
+        return required
+    
+    def get_cache_tags(self, data):
+        # Any post change bumps 'post-list'; these only matter for the
+        # related objects embedded in the page, when they were requested.
+        # Related objects are nested dicts, or bare ids in compact mode.
+        def ref(value):
+            return value['id'] if isinstance(value, dict) else value
+        
+        tags = set()
+        for post in data.get('results', []):
+            if 'id' in post:
+                tags.add(f"post:{post['id']}")
+            if post.get('author'):
+                tags.add(f"author:{ref(post['author'])}")
+            if post.get('category'):
+                tags.add(f"category:{ref(post['category'])}")
+            tags.update(f"tag:{ref(tag)}" for tag in post.get('tags', []))
+        return tags
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PostCreateUpdateSerializer
+        if self.is_compact():
+            return PostCompactListSerializer
+        if self.request.query_params.get('search'):
+            return PostSearchResultSerializer
         return PostListSerializer
     
     def get_queryset(self):
@@ -46,22 +106,24 @@ class PostListView(generics.ListCreateAPIView):
         if featured and featured.lower() == 'true':
             queryset = queryset.filter(is_featured=True)
         
-        # Search
+        # Search, ordered by relevance
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(content__icontains=search) | 
-                Q(excerpt__icontains=search)
-            )
+            return search_posts(queryset, search)
         
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
 
 
-class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PostDetailView(SparseFieldsetViewMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a blog post."""
     
-    queryset = Post.objects.select_related('author', 'category').prefetch_related('tags', 'comments__author')
+    queryset = Post.objects.select_related('author', 'category').prefetch_related(
+        'tags', 'comments__author',
+        Prefetch(
+            'related_posts',
+            queryset=RelatedPost.objects.filter(related__status='published').select_related('related'),
+        ),
+    )
     permission_classes = [IsAuthenticatedOrReadOnly]
     
     def get_serializer_class(self):
@@ -69,39 +131,149 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
             return PostCreateUpdateSerializer
         return PostDetailSerializer
     
+    # increment_view_count updates the in-memory count.
+    sparse_required_fields = ['view_count']
+    
+    def get_validators(self, request, *args, **kwargs):
+        # view_count is left out on purpose: it changes on every read, and
+        # the weak ETag treats it as an insignificant difference.  What the
+        # detail shows from other rows moves detail_updated_at.
+        post = Post.objects.filter(pk=kwargs['pk']).only(
+            'author_id', 'status', 'updated_at', 'detail_updated_at', 'like_count', 'comment_count',
+        ).first()
+        if post is None:
+            return None, None
+        # Kept for the object permission check of a 304.
+        self.validated_post = post
+        etag = make_etag(
+            'post', request.get_full_path(), post.updated_at, post.detail_updated_at,
+            post.like_count, post.comment_count,
+        )
+        return etag, max(post.updated_at, post.detail_updated_at)
+    
+    def on_not_modified(self, request, *args, **kwargs):
+        # The 304 skips get_object(), which would check these.
+        self.check_object_permissions(request, self.validated_post)
+        # A revalidated read is still a view.
+        view_counter.increment(kwargs['pk'])
+        self.track_view(request, kwargs['pk'])
+    
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         
         # Increment view count
         instance.increment_view_count()
+        self.track_view(request, instance.pk)
         
-        # Track view for analytics
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+    
+    def track_view(self, request, post_id):
+        """Track view for analytics."""
         if request.META.get('REMOTE_ADDR'):
-            PostView.objects.create(
-                post=instance,
+            post_view_spool.append(
+                post_id=post_id,
                 ip_address=request.META.get('REMOTE_ADDR'),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 referer=request.META.get('HTTP_REFERER', '')
             )
+
+
+class PostSlugDetailView(PostDetailView):
+    """Retrieve a blog post by its slug.
+    
+    The slug is resolved to an id through ``post_slugs``, and the post is
+    then loaded exactly like ``PostDetailView`` loads it by id.
+    """
+    
+    http_method_names = ['get', 'head', 'options']
+    
+    def get_queryset(self):
+        # Rejects ids cached for a slug the post no longer has.
+        return super().get_queryset().filter(slug=self.kwargs['slug'])
+    
+    def get(self, request, *args, **kwargs):
+        slug = kwargs['slug']
+        post_id, cached = post_slugs.resolve(slug)
+        try:
+            return self.get_post(request, post_id, *args, **kwargs)
+        except Http404:
+            if not cached:
+                raise
+        # Another process renamed or deleted the post; look the slug up again.
+        post_slugs.forget(slug)
+        post_id, _ = post_slugs.resolve(slug)
+        return self.get_post(request, post_id, *args, **kwargs)
+    
+    def get_post(self, request, post_id, *args, **kwargs):
+        if post_id is None:
+            raise Http404
+        self.kwargs['pk'] = kwargs['pk'] = post_id
+        return super().get(request, *args, **kwargs)
+
+
+class PostArchiveView(CachedListMixin, generics.ListAPIView):
+    """Published post counts by year and month, newest first.
+    
+    Sums the precomputed ``PostArchiveBucket`` rows instead of grouping
+    the posts.  Accepts the ``category`` and ``author`` filters of the post
+    list.
+    """
+    
+    serializer_class = ArchiveMonthSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = None
+    cache_tags = ['post-list']
+    
+    def get_queryset(self):
+        queryset = PostArchiveBucket.objects.filter(status='published')
         
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        category = self.request.query_params.get('category')
+        if category:
+            queryset = queryset.filter(category__slug=category)
+        
+        author = self.request.query_params.get('author')
+        if author:
+            queryset = queryset.filter(author__username=author)
+        
+        return queryset.values('month').annotate(count=Sum('count')).filter(count__gt=0).order_by('-month')
+
+
+class ArchiveMonthPostListView(PostListView):
+    """Published posts of one month, newest first."""
+    
+    http_method_names = ['get', 'head', 'options']
+    pagination_class = PublishedFeedPagination
+    # Read by keyset pagination.
+    sparse_required_fields = ['id', 'published_at']
+    
+    def get_queryset(self):
+        try:
+            start, end = month_range(self.kwargs['year'], self.kwargs['month'])
+        except ValueError:
+            raise Http404
+        queryset = super().get_queryset().filter(published_at__gte=start, published_at__lt=end)
+        if self.request.query_params.get('search'):
+            return queryset
+        return queryset.order_by('-published_at', '-id')
 
 
-class CategoryListView(generics.ListCreateAPIView):
+class CategoryListView(SparseFieldsetViewMixin, CachedListMixin, generics.ListCreateAPIView):
     """List and create categories."""
     
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_tags = ['category-list']
 
 
-class TagListView(generics.ListCreateAPIView):
+class TagListView(SparseFieldsetViewMixin, CachedListMixin, generics.ListCreateAPIView):
     """List and create tags."""
     
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_tags = ['tag-list']
 
 
 class CommentListView(generics.ListCreateAPIView):
@@ -111,7 +283,22 @@ class CommentListView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         post_id = self.kwargs['post_id']
-        return Comment.objects.filter(post_id=post_id, parent__isnull=True).select_related('author')
+        return Comment.objects.filter(post_id=post_id).select_related('author')
+    
+    def list(self, request, *args, **kwargs):
+        # Load the whole thread in one query and nest it in memory.
+        max_depth = settings.COMMENT_MAX_DEPTH
+        depth = request.query_params.get('depth')
+        if depth and depth.isdigit():
+            max_depth = min(int(depth), max_depth)
+        roots = build_comment_tree(self.get_queryset(), max_depth=max_depth)
+        
+        page = self.paginate_queryset(roots)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(roots, many=True)
+        return Response(serializer.data)
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -120,7 +307,9 @@ class CommentListView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         post = get_object_or_404(Post, id=self.kwargs['post_id'])
-        serializer.save(post=post)
+        # The comment and its comment_count increment commit together.
+        with transaction.atomic():
+            serializer.save(post=post)
 
 
 @api_view(['POST', 'DELETE'])
@@ -129,29 +318,103 @@ def toggle_like(request, post_id):
     """Toggle like for a post."""
     
     post = get_object_or_404(Post, id=post_id)
-    like, created = Like.objects.get_or_create(post=post, user=request.user)
     
-    if request.method == 'DELETE' or not created:
-        like.delete()
-        post.like_count = post.likes.count()
-        post.save(update_fields=['like_count'])
+    with transaction.atomic():
+        if request.method == 'POST':
+            like, created = Like.objects.get_or_create(post=post, user=request.user)
+            if created:
+                adjust_like_count(post, 1)
+                return Response({'liked': True})
+        
+        # Only the request that actually removed the row decrements the counter.
+        deleted, _ = Like.objects.filter(post=post, user=request.user).delete()
+        if deleted:
+            adjust_like_count(post, -1)
         return Response({'liked': False})
-    else:
-        post.like_count = post.likes.count()
-        post.save(update_fields=['like_count'])
-        return Response({'liked': True})
 
 
 @api_view(['GET'])
 def post_stats(request, post_id):
     """Get post statistics."""
     
-    post = get_object_or_404(Post, id=post_id)
+    stats = get_post_stats([post_id]).get(post_id)
+    if stats is None:
+        raise Http404
+    
+    etag = make_etag('post-stats', post_id, *stats.values())
+    response = not_modified(request, etag=etag)
+    if response is None:
+        response = Response(stats)
+    return set_validators(response, etag=etag)
+
+
+@api_view(['GET'])
+def post_stats_batch(request):
+    """Get statistics for several posts: ``?ids=1,2,3``."""
+    
+    try:
+        post_ids = list(dict.fromkeys(
+            int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()
+        ))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not post_ids:
+        return Response({'error': 'Missing ids'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(post_ids) > max_stats_ids():
+        return Response(
+            {'error': f'At most {max_stats_ids()} ids per request'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
     
-    stats = {
-        'view_count': post.view_count,
-        'like_count': post.like_count,
-        'comment_count': post.comment_count,
+    stats = get_post_stats(post_ids)
+    results = [{'id': post_id, **stats[post_id]} for post_id in post_ids if post_id in stats]
+    data = {
+        'results': results,
+        'not_found': [post_id for post_id in post_ids if post_id not in stats],
     }
     
-    return Response(stats)
+    etag = make_etag('post-stats-batch', [sorted(result.items()) for result in results])
+    response = not_modified(request, etag=etag)
+    if response is None:
+        response = Response(data)
+    return set_validators(response, etag=etag)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def post_analytics(request, post_id):
+    """Get daily view analytics for a post from the rollup tables."""
+    
+    post = get_object_or_404(Post, id=post_id)
+    if post.author_id != request.user.id and not request.user.is_staff:
+        return Response({'error': 'Not allowed'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        end = parse_date(request.query_params.get('end', '')) or timezone.localdate()
+        start = parse_date(request.query_params.get('start', '')) or (
+            end - timedelta(days=int(request.query_params.get('days', 30)) - 1)
+        )
+    except (ValueError, OverflowError):
+        return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end or (end - start).days >= analytics.MAX_RANGE_DAYS:
+        return Response(
+            {'error': f'Date range must cover 1 to {analytics.MAX_RANGE_DAYS} days'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    
+    return Response({
+        'post': post.id,
+        'start': start,
+        'end': end,
+        'totals': analytics.view_totals(post.id, start, end),
+        'days': analytics.daily_views(post.id, start, end),
+        'top_referers': analytics.top_referers(post.id, start, end),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """Get response cache hit and miss counters."""
+    
+    return Response(response_cache.stats())
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.feathers.resolver import backfill_feather_types
+
+
+class Command(BaseCommand):
+    help = 'Set Post.feather_type for posts whose feather predates the field.'
+
+    def handle(self, *args, **options):
+        updated = backfill_feather_types()
+        self.stdout.write(self.style.SUCCESS(f'Updated the feather type of {updated} posts.'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.feathers.storage import collect_garbage, reconcile_refcounts
+
+
+class Command(BaseCommand):
+    help = 'Delete feathers media blobs that nothing has referenced for MEDIA_BLOB_GC_GRACE_HOURS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, help='Override MEDIA_BLOB_GC_GRACE_HOURS.')
+        parser.add_argument(
+            '--reconcile', action='store_true',
+            help='Recount references from the tables first, e.g. after rows were changed with update().',
+        )
+
+    def handle(self, *args, **options):
+        if options['reconcile']:
+            corrected = reconcile_refcounts()
+            self.stdout.write(f'Corrected the reference counts of {corrected} blobs.')
+        grace = options['grace_hours']
+        deleted = collect_garbage(None if grace is None else timedelta(hours=grace))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unreferenced blobs.'))
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from apps.feathers.models import TextFeather
+from apps.feathers.rendering import RENDERER_VERSION, render_many
+
+
+class Command(BaseCommand):
+    help = 'Re-render TextFeather HTML rendered by an older renderer, using a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every text feather.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        feathers = TextFeather.objects.order_by('pk')
+        if not options['all']:
+            feathers = feathers.filter(~Q(renderer_version=RENDERER_VERSION) | Q(rendered_hash=''))
+        workers = options['workers'] or 1
+        chunk_size = options['chunk_size']
+
+        rendered = 0
+        last_pk = 0
+        # The hash each row had when read; rows saved since are left alone.
+        read_hashes = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # One chunk per worker in flight keeps memory bounded.
+                chunks = []
+                for _ in range(workers):
+                    rows = list(
+                        feathers.filter(pk__gt=last_pk).values_list('pk', 'content', 'format', 'rendered_hash')[:chunk_size]
+                    )
+                    if not rows:
+                        break
+                    chunks.append([(pk, content, format) for pk, content, format, _ in rows])
+                    read_hashes.update((pk, rendered_hash) for pk, _, _, rendered_hash in rows)
+                    last_pk = rows[-1][0]
+                if not chunks:
+                    break
+                # Workers only render; rows are written here.
+                for results in pool.map(render_many, chunks):
+                    with transaction.atomic():
+                        for pk, html, digest in results:
+                            # Like get_rendered_html: only if nobody saved the row meanwhile.
+                            rendered += TextFeather.objects.filter(pk=pk, rendered_hash=read_hashes.pop(pk)).update(
+                                rendered_html=html, rendered_hash=digest, renderer_version=RENDERER_VERSION,
+                            )
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} text feathers.'))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.feathers.uploads import sweep_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions abandoned for longer than UPLOAD_SESSION_MAX_AGE_HOURS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=float, help='Override UPLOAD_SESSION_MAX_AGE_HOURS.')
+
+    def handle(self, *args, **options):
+        max_age = options['max_age_hours']
+        swept = sweep_upload_sessions(None if max_age is None else timedelta(hours=max_age))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {swept} abandoned upload sessions.'))
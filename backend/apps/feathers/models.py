@@ -1,6 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from apps.blog.models import Post
+from .rendering import RENDERER_VERSION, content_hash, render_content
+from .storage import blob_storage
 
 User = get_user_model()
 
@@ -32,18 +36,52 @@ class TextFeather(models.Model):
         ('markdown', 'Markdown'),
         ('html', 'HTML'),
     ], default='markdown')
+    # Sanitized HTML of content, with the source hash and renderer version it was made from.
+    rendered_html = models.TextField(blank=True, editable=False)
+    rendered_hash = models.CharField(max_length=64, blank=True, editable=False)
+    renderer_version = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Text feather for {self.post.title}"
+    
+    def save(self, *args, **kwargs):
+        if (content_hash(self.content, self.format) != self.rendered_hash
+                or self.renderer_version != RENDERER_VERSION):
+            self.render()
+        super().save(*args, **kwargs)
+    
+    def render(self):
+        self.rendered_html = render_content(self.content, self.format)
+        self.rendered_hash = content_hash(self.content, self.format)
+        self.renderer_version = RENDERER_VERSION
+    
+    def get_rendered_html(self):
+        """Return the rendered HTML, re-rendering it once if the renderer or content changed.
+
+        Content written by ``QuerySet.update()`` keeps the old hash, so it
+        is caught here rather than in ``save()``.
+        """
+        if (self.renderer_version != RENDERER_VERSION
+                or self.rendered_hash != content_hash(self.content, self.format)):
+            stale_hash = self.rendered_hash
+            self.render()
+            # Only store it if nobody re-rendered in the meantime; updated_at is left alone.
+            TextFeather.objects.filter(pk=self.pk, rendered_hash=stale_hash).update(
+                rendered_html=self.rendered_html,
+                rendered_hash=self.rendered_hash,
+                renderer_version=self.renderer_version,
+            )
+        return self.rendered_html
 
 
 class PhotoFeather(models.Model):
     """Photo content feather."""
     
     post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='photo_feather')
-    image = models.ImageField(upload_to='feathers/photos/')
+    image = models.ImageField(upload_to='feathers/photos/', storage=blob_storage)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.TextField(blank=True)
     alt_text = models.CharField(max_length=200, blank=True)
     width = models.PositiveIntegerField(blank=True, null=True)
@@ -77,6 +115,7 @@ class LinkFeather(models.Model):
     title = models.CharField(max_length=200, blank=True)
     description = models.TextField(blank=True)
     thumbnail = models.ImageField(upload_to='feathers/links/', blank=True, null=True)
+    thumbnail_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -88,7 +127,7 @@ class VideoFeather(models.Model):
     """Video content feather."""
     
     post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='video_feather')
-    video_file = models.FileField(upload_to='feathers/videos/', blank=True, null=True)
+    video_file = models.FileField(upload_to='feathers/videos/', storage=blob_storage, blank=True, null=True)
     video_url = models.URLField(blank=True, help_text='External video URL (YouTube, Vimeo, etc.)')
     thumbnail = models.ImageField(upload_to='feathers/videos/thumbnails/', blank=True, null=True)
     caption = models.TextField(blank=True)
@@ -104,7 +143,7 @@ class AudioFeather(models.Model):
     """Audio content feather."""
     
     post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='audio_feather')
-    audio_file = models.FileField(upload_to='feathers/audio/')
+    audio_file = models.FileField(upload_to='feathers/audio/', storage=blob_storage)
     title = models.CharField(max_length=200, blank=True)
     artist = models.CharField(max_length=200, blank=True)
     duration = models.DurationField(blank=True, null=True)
@@ -131,10 +170,11 @@ class UploaderFeather(models.Model):
 class UploadedFile(models.Model):
     """Individual uploaded files."""
     
-    file = models.FileField(upload_to='feathers/uploads/')
+    file = models.FileField(upload_to='feathers/uploads/', storage=blob_storage)
     original_name = models.CharField(max_length=255)
-    file_size = models.PositiveIntegerField()
+    file_size = models.PositiveBigIntegerField()
     mime_type = models.CharField(max_length=100)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
@@ -153,3 +193,42 @@ class UploadedFile(models.Model):
                 return f"{size:.1f} {unit}"
             size /= 1024.0
         return f"{size:.1f} TB"
+
+
+class UploadSession(models.Model):
+    """A chunked upload in progress.
+    
+    Chunks are appended at ``offset`` to a part file in
+    ``UPLOAD_SESSION_DIR`` until ``size`` bytes arrived; committing the
+    session turns the part file into an ``UploadedFile``.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    original_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.original_name} ({self.offset}/{self.size})"
+
+
+class Blob(models.Model):
+    """A file in ``blob_storage`` and the number of fields referencing it."""
+    
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
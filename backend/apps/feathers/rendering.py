@@ -0,0 +1,42 @@
+"""
+Server-side rendering of TextFeather content to sanitized HTML.
+
+``render_content`` converts plain text, markdown or HTML into HTML that
+is safe to embed, stripping scripts, event handlers and unknown tags.
+Rendered output is stored with the hash of its source and
+``RENDERER_VERSION``; bump the version whenever the output of
+``render_content`` changes so stored HTML is re-rendered.
+
+This module must not touch the ORM: the bulk re-render command calls
+``render_many`` in worker processes.
+"""
+import hashlib
+
+import markdown
+import nh3
+from django.utils.html import escape, linebreaks
+
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+
+
+def content_hash(content, format):
+    return hashlib.sha256(f'{format}\0{content}'.encode()).hexdigest()
+
+
+def render_content(content, format):
+    """Return sanitized HTML for ``content`` in the given TextFeather format."""
+    if format == 'plain':
+        return linebreaks(escape(content))
+    if format == 'markdown':
+        content = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+    return nh3.clean(content)
+
+
+def render_many(items):
+    """Render ``[(pk, content, format)]`` into ``[(pk, html, hash)]``."""
+    return [
+        (pk, render_content(content, format), content_hash(content, format))
+        for pk, content, format in items
+    ]
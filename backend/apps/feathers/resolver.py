@@ -0,0 +1,108 @@
+"""
+Loading a post's feather without probing every feather table.
+
+``Post.feather_type`` names the table holding the post body, so a page
+of posts needs one query per feather type present on it, and a single
+post needs one query for its feather.  A post with feathers of several
+types keeps the type of the first one created.
+"""
+from django.utils import timezone
+
+from apps.blog.caching import response_cache
+from apps.blog.models import Post
+from .models import (
+    TextFeather, PhotoFeather, QuoteFeather, LinkFeather,
+    VideoFeather, AudioFeather, UploaderFeather
+)
+
+FEATHER_MODELS = {
+    'text': TextFeather,
+    'photo': PhotoFeather,
+    'quote': QuoteFeather,
+    'link': LinkFeather,
+    'video': VideoFeather,
+    'audio': AudioFeather,
+    'uploader': UploaderFeather,
+}
+
+FEATHER_TYPES = {model: feather_type for feather_type, model in FEATHER_MODELS.items()}
+
+
+def feather_queryset(feather_type):
+    queryset = FEATHER_MODELS[feather_type].objects.all()
+    if feather_type == 'uploader':
+        queryset = queryset.prefetch_related('files')
+    return queryset
+
+
+def attach_feathers(posts):
+    """Set ``post.feather`` on every post, with one query per feather type present."""
+    by_type = {}
+    for post in posts:
+        post.feather = None
+        if post.feather_type:
+            by_type.setdefault(post.feather_type, {})[post.pk] = post
+    for feather_type, by_post in by_type.items():
+        for feather in feather_queryset(feather_type).filter(post_id__in=by_post):
+            by_post[feather.post_id].feather = feather
+    return posts
+
+
+def get_feather(post):
+    """Return the post's feather, loading it if ``attach_feathers`` did not."""
+    if not hasattr(post, 'feather'):
+        attach_feathers([post])
+    return post.feather
+
+
+def touch_posts(post_ids):
+    """Invalidate the cached responses of posts whose feathers changed."""
+    response_cache.invalidate_on_commit('post-list', *(f'post:{post_id}' for post_id in post_ids))
+
+
+def claim_feather_type(post_ids, feather_type):
+    """Point the posts without a feather type at ``feather_type``.
+
+    Posts that have one keep it, and are not written to.
+    """
+    Post.objects.filter(pk__in=post_ids, feather_type='').update(
+        feather_type=feather_type, updated_at=timezone.now(),
+    )
+
+
+def oldest_feather_type(post_id, exclude=None):
+    """Return the type of the post's oldest feather, or ''."""
+    created = {}
+    for feather_type, model in FEATHER_MODELS.items():
+        if feather_type != exclude:
+            created_at = model.objects.filter(post_id=post_id).values_list('created_at', flat=True).first()
+            if created_at is not None:
+                created[feather_type] = created_at
+    return min(created, key=created.get, default='')
+
+
+def release_feather_type(post_id, feather_type):
+    """Point a post whose ``feather_type`` feather was deleted at its oldest other one."""
+    if not Post.objects.filter(pk=post_id, feather_type=feather_type).exists():
+        return
+    Post.objects.filter(pk=post_id, feather_type=feather_type).update(
+        feather_type=oldest_feather_type(post_id, exclude=feather_type), updated_at=timezone.now(),
+    )
+
+
+def backfill_feather_types():
+    """Set ``feather_type`` from the feather tables; returns the number of posts updated."""
+    oldest = {}
+    for feather_type, model in FEATHER_MODELS.items():
+        for post_id, created_at in model.objects.values_list('post_id', 'created_at').iterator():
+            if post_id not in oldest or created_at < oldest[post_id][0]:
+                oldest[post_id] = (created_at, feather_type)
+    by_type = {}
+    for post_id, (_, feather_type) in oldest.items():
+        by_type.setdefault(feather_type, []).append(post_id)
+    updated = 0
+    for feather_type, post_ids in by_type.items():
+        updated += Post.objects.filter(pk__in=post_ids).exclude(feather_type=feather_type).update(
+            feather_type=feather_type,
+        )
+    return updated
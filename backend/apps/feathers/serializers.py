@@ -1,11 +1,20 @@
+import os
+
 from rest_framework import serializers
+from django.conf import settings
+from apps.blog.fieldsets import SparseFieldsetMixin
+from apps.media.serializers import SrcsetField
+from apps.blog.serializers import PostCompactListSerializer, PostDetailSerializer, PostListSerializer
 from .models import (
     FeatherType, TextFeather, PhotoFeather, QuoteFeather, LinkFeather,
-    VideoFeather, AudioFeather, UploaderFeather, UploadedFile
+    VideoFeather, AudioFeather, UploaderFeather, UploadedFile, UploadSession
 )
+from .resolver import get_feather
+from .storage import blob_sha256, blob_storage
+from .uploads import sniff_file
 
 
-class FeatherTypeSerializer(serializers.ModelSerializer):
+class FeatherTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for FeatherType model."""
     
     class Meta:
@@ -13,7 +22,7 @@ class FeatherTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'icon', 'is_active', 'created_at']
 
 
-class UploadedFileSerializer(serializers.ModelSerializer):
+class UploadedFileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for UploadedFile model."""
     
     file_size_human = serializers.ReadOnlyField()
@@ -21,27 +30,55 @@ class UploadedFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UploadedFile
         fields = ['id', 'file', 'original_name', 'file_size', 'file_size_human', 
-                 'mime_type', 'uploaded_at']
+                 'mime_type', 'sha256', 'uploaded_at']
+
+
+class UploadField(serializers.PrimaryKeyRelatedField):
+    """A committed upload of the requesting user, by id."""
+    
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return UploadedFile.objects.none()
+        return UploadedFile.objects.filter(uploaded_by=request.user)
 
 
-class TextFeatherSerializer(serializers.ModelSerializer):
+class TextFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for TextFeather model."""
     
+    rendered_html = serializers.CharField(source='get_rendered_html', read_only=True)
+    
     class Meta:
         model = TextFeather
-        fields = ['id', 'content', 'format', 'created_at', 'updated_at']
+        fields = ['id', 'content', 'format', 'rendered_html', 'created_at', 'updated_at']
 
 
-class PhotoFeatherSerializer(serializers.ModelSerializer):
+class PhotoFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for PhotoFeather model."""
     
+    image_srcset = SrcsetField('image')
+    upload = UploadField(write_only=True, required=False)
+    
     class Meta:
         model = PhotoFeather
-        fields = ['id', 'image', 'caption', 'alt_text', 'width', 'height', 
+        fields = ['id', 'image', 'image_srcset', 'upload', 'caption', 'alt_text', 'width', 'height', 
                  'created_at', 'updated_at']
+        # Filled in from the image when its derivatives are built.
+        read_only_fields = ['width', 'height']
+        extra_kwargs = {'image': {'required': False}}
+    
+    def validate(self, attrs):
+        upload = attrs.pop('upload', None)
+        if upload is not None:
+            if not upload.mime_type.startswith('image/'):
+                raise serializers.ValidationError({'upload': ['Not an image file.']})
+            attrs['image'] = upload.file.name
+        elif self.instance is None and not attrs.get('image'):
+            raise serializers.ValidationError({'image': ['Send a file or an upload id.']})
+        return attrs
 
 
-class QuoteFeatherSerializer(serializers.ModelSerializer):
+class QuoteFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for QuoteFeather model."""
     
     class Meta:
@@ -49,41 +86,143 @@ class QuoteFeatherSerializer(serializers.ModelSerializer):
         fields = ['id', 'quote', 'author', 'source', 'created_at', 'updated_at']
 
 
-class LinkFeatherSerializer(serializers.ModelSerializer):
+class LinkFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for LinkFeather model."""
     
+    thumbnail_srcset = SrcsetField('thumbnail')
+    
     class Meta:
         model = LinkFeather
-        fields = ['id', 'url', 'title', 'description', 'thumbnail', 
+        fields = ['id', 'url', 'title', 'description', 'thumbnail', 'thumbnail_srcset',
                  'created_at', 'updated_at']
 
 
-class VideoFeatherSerializer(serializers.ModelSerializer):
+class VideoFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for VideoFeather model."""
     
+    upload = UploadField(write_only=True, required=False)
+    
     class Meta:
         model = VideoFeather
-        fields = ['id', 'video_file', 'video_url', 'thumbnail', 'caption', 
+        fields = ['id', 'video_file', 'upload', 'video_url', 'thumbnail', 'caption', 
                  'duration', 'created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        upload = attrs.pop('upload', None)
+        if upload is not None:
+            if not upload.mime_type.startswith('video/'):
+                raise serializers.ValidationError({'upload': ['Not a video file.']})
+            attrs['video_file'] = upload.file.name
+        return attrs
 
 
-class AudioFeatherSerializer(serializers.ModelSerializer):
+class AudioFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for AudioFeather model."""
     
+    upload = UploadField(write_only=True, required=False)
+    
     class Meta:
         model = AudioFeather
-        fields = ['id', 'audio_file', 'title', 'artist', 'duration', 
+        fields = ['id', 'audio_file', 'upload', 'title', 'artist', 'duration', 
                  'created_at', 'updated_at']
+        extra_kwargs = {'audio_file': {'required': False}}
+    
+    def validate(self, attrs):
+        upload = attrs.pop('upload', None)
+        if upload is not None:
+            if not upload.mime_type.startswith('audio/'):
+                raise serializers.ValidationError({'upload': ['Not an audio file.']})
+            attrs['audio_file'] = upload.file.name
+        elif self.instance is None and not attrs.get('audio_file'):
+            raise serializers.ValidationError({'audio_file': ['Send a file or an upload id.']})
+        return attrs
 
 
-class UploaderFeatherSerializer(serializers.ModelSerializer):
+class UploaderFeatherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for UploaderFeather model."""
     
     files = UploadedFileSerializer(many=True, read_only=True)
+    uploads = UploadField(many=True, write_only=True, required=False, source='files')
     
     class Meta:
         model = UploaderFeather
-        fields = ['id', 'files', 'description', 'created_at', 'updated_at']
+        fields = ['id', 'files', 'uploads', 'description', 'created_at', 'updated_at']
+
+
+FEATHER_SERIALIZERS = {
+    'text': TextFeatherSerializer,
+    'photo': PhotoFeatherSerializer,
+    'quote': QuoteFeatherSerializer,
+    'link': LinkFeatherSerializer,
+    'video': VideoFeatherSerializer,
+    'audio': AudioFeatherSerializer,
+    'uploader': UploaderFeatherSerializer,
+}
+
+
+def serialize_feather(post, context):
+    feather = get_feather(post)
+    if feather is None:
+        return None
+    # ?fields= applies to the post, not to the feather nested in it.
+    context = {**context, 'apply_fieldsets': False}
+    return FEATHER_SERIALIZERS[post.feather_type](feather, context=context).data
+
+
+class PostFeatherListSerializer(PostListSerializer):
+    """Serializer for Post lists with each post's feather."""
+    
+    feather = serializers.SerializerMethodField()
+    
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ['feather_type', 'feather']
+    
+    def get_feather(self, obj):
+        return serialize_feather(obj, self.context)
+
+
+class PostFeatherCompactListSerializer(PostCompactListSerializer):
+    """Serializer for compact Post lists with each post's feather."""
+    
+    feather = serializers.SerializerMethodField()
+    
+    class Meta(PostCompactListSerializer.Meta):
+        fields = PostCompactListSerializer.Meta.fields + ['feather_type', 'feather']
+    
+    def get_feather(self, obj):
+        return serialize_feather(obj, self.context)
+
+
+class PostFeatherDetailSerializer(PostDetailSerializer):
+    """Serializer for Post detail with the post's feather."""
+    
+    feather = serializers.SerializerMethodField()
+    
+    class Meta(PostDetailSerializer.Meta):
+        fields = PostDetailSerializer.Meta.fields + ['feather_type', 'feather']
+    
+    def get_feather(self, obj):
+        return serialize_feather(obj, self.context)
+
+
+class BulkFeatherItemSerializer(serializers.Serializer):
+    """One item of a bulk feather creation request."""
+    
+    post = serializers.IntegerField()
+    type = serializers.ChoiceField(choices=list(FEATHER_SERIALIZERS))
+    data = serializers.DictField()
+
+
+class BulkFeatherSerializer(serializers.Serializer):
+    """Envelope of a bulk feather creation request."""
+    
+    items = BulkFeatherItemSerializer(many=True, allow_empty=False)
+    
+    def validate_items(self, items):
+        limit = settings.FEATHER_BULK_MAX_ITEMS
+        if len(items) > limit:
+            raise serializers.ValidationError(f'At most {limit} items per request.')
+        return items
 
 
 class FileUploadSerializer(serializers.ModelSerializer):
@@ -95,10 +234,45 @@ class FileUploadSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         file = validated_data['file']
+        # The declared content type is whatever the client claims.
+        mime_type = sniff_file(file)
+        # Stored first so the name, which is the content hash, is known.
+        name = blob_storage.save(file.name, file)
         validated_data.update({
+            'file': name,
             'original_name': file.name,
             'file_size': file.size,
-            'mime_type': file.content_type,
+            'mime_type': mime_type,
+            'sha256': blob_sha256(name),
             'uploaded_by': self.context['request'].user
         })
         return super().create(validated_data)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for chunked upload sessions."""
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_name', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'updated_at']
+    
+    def validate_original_name(self, value):
+        # The file is saved under this name on commit; keep only its last part.
+        name = os.path.basename(value.replace('\\', '/')).strip()
+        if name in ('', '.', '..'):
+            raise serializers.ValidationError('Invalid file name.')
+        return name
+    
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Size must be positive.')
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Uploads are limited to {settings.UPLOAD_MAX_SIZE} bytes.')
+        return value
+
+
+class UploadCommitSerializer(serializers.Serializer):
+    """Optional checksum the committed upload must match."""
+    
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
@@ -0,0 +1,66 @@
+from collections import Counter
+
+from django.apps import apps
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from apps.blog.caching import response_cache
+from .models import FeatherType
+from .resolver import FEATHER_TYPES, claim_feather_type, release_feather_type, touch_posts
+from .storage import BLOB_FIELDS, adjust_refs, blob_fields, file_names
+
+
+@receiver(post_save, sender=FeatherType)
+@receiver(post_delete, sender=FeatherType)
+def invalidate_feather_type_responses(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit('feather-type-list')
+
+
+def record_feather_type(sender, instance, created, **kwargs):
+    """Point Post.feather_type at a new feather unless it has one; its post body changed."""
+    if created:
+        claim_feather_type([instance.post_id], FEATHER_TYPES[sender])
+    touch_posts([instance.post_id])
+
+
+def clear_feather_type(sender, instance, **kwargs):
+    release_feather_type(instance.post_id, FEATHER_TYPES[sender])
+    touch_posts([instance.post_id])
+
+
+def remember_blobs(sender, instance, **kwargs):
+    # New rows reference nothing yet, whatever they were built with.
+    instance._stored_blobs = file_names(instance, blob_fields(sender)) if instance.pk is not None else {}
+
+
+def count_blob_references(sender, instance, update_fields=None, **kwargs):
+    """Move references from the blobs a row pointed to onto the ones it points to now."""
+    fields = [field for field in blob_fields(sender) if update_fields is None or field in update_fields]
+    if not fields:
+        return
+    deltas = Counter()
+    stored = instance._stored_blobs
+    for field, name in file_names(instance, fields).items():
+        if stored.get(field) != name:
+            deltas[name] += 1
+            if field in stored:
+                deltas[stored[field]] -= 1
+            stored[field] = name
+    adjust_refs(deltas)
+
+
+def release_blobs(sender, instance, **kwargs):
+    adjust_refs({name: -1 for name in instance._stored_blobs.values()})
+
+
+def connect_signals():
+    # Per model: a sender-less receiver would listen to every model and
+    # keep Django from fast-deleting unrelated rows.
+    for model, feather_type in FEATHER_TYPES.items():
+        post_save.connect(record_feather_type, sender=model, dispatch_uid=f'feathers-record-{feather_type}')
+        post_delete.connect(clear_feather_type, sender=model, dispatch_uid=f'feathers-clear-{feather_type}')
+    for label in BLOB_FIELDS:
+        model = apps.get_model(label)
+        post_init.connect(remember_blobs, sender=model, dispatch_uid=f'feathers-remember-blobs-{label}')
+        post_save.connect(count_blob_references, sender=model, dispatch_uid=f'feathers-count-blobs-{label}')
+        post_delete.connect(release_blobs, sender=model, dispatch_uid=f'feathers-release-blobs-{label}')
@@ -0,0 +1,292 @@
+"""
+Content-addressed, deduplicating storage for feathers media.
+
+``blob_storage`` stores a file under ``blobs/<2 hex>/<2 hex>/<sha256><ext>``.
+The extension comes from the sniffed MIME type, so it depends only on the
+bytes too.  The SHA-256 is computed while the upload streams to a
+temporary file, and bytes that are already stored are not written again.
+A blob's name never changes meaning, so its URL can be cached forever.
+
+``Blob`` rows count the references to each blob from the fields in
+``BLOB_FIELDS``.  Storing a file creates or touches its row, feather
+signals keep the counts, and ``collect_garbage`` deletes blobs nobody has
+referenced for ``MEDIA_BLOB_GC_GRACE_HOURS``.  The grace period covers
+files stored by uploads whose rows are not committed yet.  Both sides
+take the ``Blob`` row lock, so a blob is never deleted while it is being
+stored again.  ``blob_storage.delete`` never deletes a blob, since other
+rows may share it.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from .uploads import READ_SIZE, SNIFF_SIZE, sniff_mime_type
+
+BLOB_PREFIX = 'blobs/'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})(\.[\w.-]+)?$')
+
+# Model label -> file fields stored in blob_storage.
+BLOB_FIELDS = {
+    'feathers.UploadedFile': ['file'],
+    'feathers.PhotoFeather': ['image'],
+    'feathers.AudioFeather': ['audio_file'],
+    'feathers.VideoFeather': ['video_file'],
+}
+
+# The ones of BLOB_FIELDS published with posts.  Uploads are private to
+# the API until a feather references their blob.
+PUBLIC_BLOB_FIELDS = {label: fields for label, fields in BLOB_FIELDS.items() if label != 'feathers.UploadedFile'}
+
+
+def blob_fields(model):
+    """Return the model's fields stored in ``blob_storage``."""
+    return BLOB_FIELDS.get(model._meta.label, [])
+
+
+def is_blob(name):
+    return bool(name) and BLOB_NAME.match(name) is not None
+
+
+def is_public_blob(name):
+    """Return whether a field in ``PUBLIC_BLOB_FIELDS`` references blob ``name``."""
+    from django.apps import apps
+
+    return any(
+        apps.get_model(label).objects.filter(**{field: name}).exists()
+        for label, fields in PUBLIC_BLOB_FIELDS.items() for field in fields
+    )
+
+
+def blob_sha256(name):
+    """Return the SHA-256 a blob name was derived from, or '' for other names."""
+    match = BLOB_NAME.match(name or '')
+    return match.group('sha256') if match else ''
+
+
+def blob_name(sha256, head):
+    extension = mimetypes.guess_extension(sniff_mime_type(head)) or ''
+    return f'{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after their SHA-256."""
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the name; identical bytes share it on purpose.
+        return name
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            return self._save_file(content)
+        return self._save_stream(content)
+
+    def _save_stream(self, content):
+        """Hash the content while copying it to a temporary file in the storage."""
+        temp_dir = self.path(f'{BLOB_PREFIX}tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        head = b''
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    if len(head) < SNIFF_SIZE:
+                        head += chunk[:SNIFF_SIZE - len(head)]
+                    digest.update(chunk)
+                    temp.write(chunk)
+            except BaseException:
+                temp.close()
+                os.unlink(temp.name)
+                raise
+        return self._store(temp.name, digest.hexdigest(), head, move=True)
+
+    def _save_file(self, content):
+        """Store a file already on disk, moving it instead of copying."""
+        path = content.temporary_file_path()
+        sha256 = getattr(content, 'sha256', None)
+        with open(path, 'rb') as source:
+            head = source.read(SNIFF_SIZE)
+            if sha256 is None:
+                digest = hashlib.sha256(head)
+                for block in iter(lambda: source.read(READ_SIZE), b''):
+                    digest.update(block)
+                sha256 = digest.hexdigest()
+        return self._store(path, sha256, head, move=False)
+
+    def _store(self, path, sha256, head, move):
+        from .models import Blob
+
+        name = blob_name(sha256, head)
+        full_path = self.path(name)
+        with transaction.atomic():
+            # Locks the row, if any, until the file is in place: collect_garbage
+            # waits, then finds it fresh.  If it deleted the blob first, the file
+            # is written again below.
+            Blob.objects.filter(name=name).update(updated_at=timezone.now())
+            if os.path.exists(full_path):
+                # Already stored; refresh its age so garbage collection spares it.
+                os.utime(full_path)
+                if move:
+                    os.unlink(path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if move:
+                    os.replace(path, full_path)
+                else:
+                    file_move_safe(path, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            create_blobs([name])
+        return name
+
+    def delete(self, name):
+        """Blobs may be shared; only ``collect_garbage`` deletes them."""
+        if not is_blob(name):
+            super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def adjust_refs(deltas):
+    """Apply ``{blob name: reference delta}``, creating ``Blob`` rows as needed."""
+    from .models import Blob
+
+    deltas = {name: delta for name, delta in deltas.items() if delta and is_blob(name)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        create_blobs(deltas)
+        # In name order, like reconcile_refcounts, so row locks can't deadlock.
+        for name, delta in sorted(deltas.items()):
+            Blob.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=timezone.now())
+
+
+def create_blobs(names):
+    """Create the missing ``Blob`` rows of ``names``, unreferenced."""
+    from .models import Blob
+
+    existing = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+    Blob.objects.bulk_create(
+        [Blob(name=name, sha256=blob_sha256(name), size=_size(name)) for name in names if name not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def _size(name):
+    try:
+        return blob_storage.size(name)
+    except OSError:
+        return 0
+
+
+def file_names(instance, fields):
+    """Return ``{field: file name}`` for the loaded ones of ``fields``."""
+    values = instance.__dict__
+    return {field: getattr(values[field], 'name', values[field]) or '' for field in fields if field in values}
+
+
+def reference_blobs(model, instances):
+    """Count references from rows saved without post_save, e.g. by ``bulk_create``."""
+    adjust_refs(Counter(
+        name for instance in instances for name in file_names(instance, blob_fields(model)).values()
+    ))
+
+
+def reconcile_refcounts():
+    """Recount every blob's references from the tables; returns the blobs corrected.
+
+    The ``Blob`` rows stay locked from before the count until the counts
+    are written, so references saved meanwhile are adjusted after it.
+    """
+    from django.apps import apps
+    from .models import Blob
+
+    with transaction.atomic():
+        blobs = list(Blob.objects.select_for_update().order_by('name').values_list('pk', 'name', 'refcount'))
+        counts = Counter()
+        for label, fields in BLOB_FIELDS.items():
+            model = apps.get_model(label)
+            for field in fields:
+                counts.update(
+                    name for name in model.objects.filter(**{f'{field}__startswith': BLOB_PREFIX})
+                    .values_list(field, flat=True) if is_blob(name)
+                )
+        known = {name for _, name, _ in blobs}
+        missing = [name for name in counts if name not in known]
+        create_blobs(missing)
+        blobs += Blob.objects.select_for_update().filter(name__in=missing).values_list('pk', 'name', 'refcount')
+        corrected = 0
+        for pk, name, refcount in blobs:
+            if refcount != counts.get(name, 0):
+                Blob.objects.filter(pk=pk).update(refcount=counts.get(name, 0), updated_at=timezone.now())
+                corrected += 1
+    return corrected
+
+
+def collect_garbage(grace=None):
+    """Delete blobs unreferenced for longer than ``grace``; returns the number deleted.
+
+    Blob files without a ``Blob`` row, e.g. from before rows were created
+    on store, are given an unreferenced row and collected like any other
+    once the grace period has passed again.  Abandoned temporary files
+    are deleted once they are as old.
+    """
+    from .models import Blob
+
+    if grace is None:
+        grace = timedelta(hours=getattr(settings, 'MEDIA_BLOB_GC_GRACE_HOURS', 24))
+    cutoff = timezone.now() - grace
+    deleted = 0
+    for blob in Blob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).iterator():
+        with transaction.atomic():
+            # Still unreferenced, and not stored again, now that the row is locked.
+            if not Blob.objects.select_for_update().filter(pk=blob.pk, refcount__lte=0, updated_at__lt=cutoff).exists():
+                continue
+            if _younger_than(blob.name, cutoff):
+                continue
+            Blob.objects.filter(pk=blob.pk).delete()
+            blob_storage.delete_blob(blob.name)
+            deleted += 1
+
+    root = blob_storage.path(BLOB_PREFIX)
+    if os.path.isdir(root):
+        known = set(Blob.objects.values_list('name', flat=True))
+        orphans = []
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                name = os.path.relpath(os.path.join(directory, filename), blob_storage.location).replace(os.sep, '/')
+                if name in known or _younger_than(name, cutoff):
+                    continue
+                if is_blob(name):
+                    # Deleting it here could race a store; only rows are collected.
+                    orphans.append(name)
+                elif name.startswith(f'{BLOB_PREFIX}tmp/'):
+                    blob_storage.delete_blob(name)
+                    deleted += 1
+        create_blobs(orphans)
+    return deleted
+
+
+def _younger_than(name, cutoff):
+    try:
+        return os.path.getmtime(blob_storage.path(name)) >= cutoff.timestamp()
+    except OSError:
+        return False
@@ -0,0 +1,233 @@
+"""
+Chunked, resumable uploads.
+
+A client opens an ``UploadSession`` with the file's name and size, sends
+the bytes as ``PATCH`` requests carrying their ``Upload-Offset``, and
+commits the session once all bytes arrived.  Each chunk is streamed from
+the request straight into the session's part file and fsynced before the
+session's offset moves, so after a disconnect the client asks for the
+offset and resumes from there.  No database lock is held while a chunk
+streams in: a lock on the part file keeps chunks of a session apart, and
+the offset moves with a conditional update.  The SHA-256 of the part
+file is kept up to date as chunks arrive; a process that didn't see the
+earlier chunks hashes the part file once and carries on from there.
+
+MIME types are sniffed from the file's leading bytes instead of trusting
+the type the client declared.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunks of one session aren't serialized.
+    fcntl = None
+
+READ_SIZE = 64 * 1024
+SNIFF_SIZE = 512
+MAX_CACHED_HASHERS = 256
+
+# (offset, signature, MIME type), checked in order.
+MIME_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'\xff\xf3', 'audio/mpeg'),
+    (0, b'\xff\xf2', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (4, b'ftypM4A ', 'audio/mp4'),
+    (4, b'ftypqt  ', 'video/quicktime'),
+    (4, b'ftyp', 'video/mp4'),
+]
+
+# RIFF containers, by the form type at offset 8.
+RIFF_TYPES = {
+    b'WAVE': 'audio/wav',
+    b'WEBP': 'image/webp',
+    b'AVI ': 'video/x-msvideo',
+}
+
+
+def sniff_mime_type(head):
+    """Return the MIME type of a file from its first ``SNIFF_SIZE`` bytes."""
+    for offset, signature, mime_type in MIME_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime_type
+    if head.startswith(b'RIFF') and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]]
+    if head.startswith(b'OggS'):
+        return 'video/ogg' if b'\x80theora' in head else 'audio/ogg'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm' if b'webm' in head else 'video/x-matroska'
+    try:
+        text = head.decode('utf-8')
+    except UnicodeDecodeError:
+        # The sample may end inside a multi-byte character.
+        try:
+            text = head[:-3].decode('utf-8')
+        except UnicodeDecodeError:
+            text = None
+    if text is not None and '\0' not in text:
+        return 'text/plain'
+    return 'application/octet-stream'
+
+
+def sniff_file(file):
+    """Sniff the MIME type of a Django ``File``, leaving it at its start."""
+    file.seek(0)
+    head = file.read(SNIFF_SIZE)
+    file.seek(0)
+    return sniff_mime_type(head)
+
+
+def upload_dir():
+    return Path(getattr(settings, 'UPLOAD_SESSION_DIR', settings.BASE_DIR / 'var' / 'uploads'))
+
+
+def part_path(session_id):
+    return upload_dir() / f'{session_id}.part'
+
+
+def create_part(session_id):
+    directory = upload_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    part_path(session_id).touch()
+
+
+def remove_part(session_id):
+    forget_hasher(session_id)
+    try:
+        part_path(session_id).unlink()
+    except FileNotFoundError:
+        pass
+
+
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def session_hasher(session_id, offset):
+    """Return a SHA-256 hasher fed with the first ``offset`` bytes of the part file."""
+    with _hashers_lock:
+        cached = _hashers.pop(session_id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    with open(part_path(session_id), 'rb') as part:
+        remaining = offset
+        while remaining:
+            block = part.read(min(READ_SIZE, remaining))
+            if not block:
+                raise ValueError(f'Part file of upload {session_id} is shorter than {offset} bytes')
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def remember_hasher(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        _hashers.move_to_end(session_id)
+        while len(_hashers) > MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def forget_hasher(session_id):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+
+
+class PartLocked(Exception):
+    """Another request is writing a chunk of the same session."""
+
+
+@contextmanager
+def part_lock(session_id):
+    """Hold the lock of a session's part file, or raise PartLocked at once.
+
+    Waiting would park the request behind a writer whose client may have
+    gone away; the lock is released when that request ends, however it
+    ends, and the client can retry then.
+    """
+    with open(part_path(session_id), 'rb') as part:
+        if fcntl is not None:
+            try:
+                fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise PartLocked(session_id)
+        yield
+
+
+def write_chunk(session_id, offset, stream, length, hasher):
+    """Copy ``length`` bytes from ``stream`` into the part file at ``offset``.
+
+    Bytes past ``offset`` left by an interrupted chunk are discarded
+    first.  Returns the number of bytes written and synced, which is less
+    than ``length`` if the client went away; the error is not raised.
+    """
+    written = 0
+    with open(part_path(session_id), 'r+b') as part:
+        part.truncate(offset)
+        part.seek(offset)
+        try:
+            while written < length:
+                block = stream.read(min(READ_SIZE, length - written))
+                if not block:
+                    break
+                part.write(block)
+                hasher.update(block)
+                written += len(block)
+        except OSError:
+            pass
+        finally:
+            part.flush()
+            os.fsync(part.fileno())
+    return written
+
+
+class PartFile(File):
+    """A complete part file, which file system storage moves instead of copying."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def sweep_upload_sessions(max_age=None):
+    """Delete sessions idle for longer than ``max_age`` and orphaned part files.
+
+    Returns the number of sessions deleted.
+    """
+    from .models import UploadSession
+
+    if max_age is None:
+        max_age = timedelta(hours=getattr(settings, 'UPLOAD_SESSION_MAX_AGE_HOURS', 24))
+    cutoff = timezone.now() - max_age
+    stale = set(UploadSession.objects.filter(updated_at__lt=cutoff).values_list('pk', flat=True))
+    # Sessions that received a chunk meanwhile survive the delete.
+    UploadSession.objects.filter(pk__in=stale, updated_at__lt=cutoff).delete()
+    stale -= set(UploadSession.objects.filter(pk__in=stale).values_list('pk', flat=True))
+    for session_id in stale:
+        remove_part(session_id)
+
+    # Part files whose session row is gone, e.g. after a crash mid-commit.
+    directory = upload_dir()
+    if directory.is_dir():
+        known = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for path in directory.glob('*.part'):
+            if path.stem not in known and path.stat().st_mtime < cutoff.timestamp():
+                path.unlink(missing_ok=True)
+    return len(stale)
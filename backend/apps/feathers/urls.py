@@ -4,6 +4,14 @@ from . import views
 urlpatterns = [
     path('types/', views.FeatherTypeListView.as_view(), name='feather-type-list'),
     path('upload/', views.upload_file, name='file-upload'),
+    path('uploads/', views.start_upload, name='upload-session-create'),
+    path('uploads/<uuid:session_id>/', views.upload_session, name='upload-session'),
+    path('uploads/<uuid:session_id>/commit/', views.commit_upload, name='upload-session-commit'),
+    path('bulk/', views.bulk_create_feathers, name='feather-bulk-create'),
+    
+    # Posts with their feathers
+    path('posts/', views.PostFeatherListView.as_view(), name='post-feather-list'),
+    path('posts/<int:pk>/', views.PostFeatherDetailView.as_view(), name='post-feather-detail'),
     
     # Text feathers
     path('text/<int:pk>/', views.TextFeatherView.as_view(), name='text-feather-detail'),
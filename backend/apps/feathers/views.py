@@ -2,35 +2,54 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from apps.blog.caching import CachedListMixin
+from apps.blog.fieldsets import SparseFieldsetViewMixin, sparse_field_names
+from apps.blog.views import PostDetailView, PostListView
+from apps.media.derivatives import queue_images
 from .models import (
     FeatherType, TextFeather, PhotoFeather, QuoteFeather, LinkFeather,
-    VideoFeather, AudioFeather, UploaderFeather, UploadedFile
+    VideoFeather, AudioFeather, UploaderFeather, UploadedFile, UploadSession
 )
 from .serializers import (
     FeatherTypeSerializer, TextFeatherSerializer, PhotoFeatherSerializer,
     QuoteFeatherSerializer, LinkFeatherSerializer, VideoFeatherSerializer,
-    AudioFeatherSerializer, UploaderFeatherSerializer, FileUploadSerializer
+    AudioFeatherSerializer, UploaderFeatherSerializer, FileUploadSerializer,
+    PostFeatherListSerializer, PostFeatherCompactListSerializer, PostFeatherDetailSerializer,
+    BulkFeatherSerializer, UploadSessionSerializer, UploadCommitSerializer, FEATHER_SERIALIZERS
+)
+from .resolver import FEATHER_MODELS, attach_feathers, claim_feather_type, touch_posts
+from .storage import reference_blobs
+from .uploads import (
+    SNIFF_SIZE, PartFile, PartLocked, create_part, part_lock, part_path, remember_hasher,
+    remove_part, session_hasher, sniff_mime_type, write_chunk
 )
 
 
-class FeatherTypeListView(generics.ListAPIView):
+class FeatherTypeListView(SparseFieldsetViewMixin, CachedListMixin, generics.ListAPIView):
     """List all available feather types."""
     
     queryset = FeatherType.objects.filter(is_active=True)
     serializer_class = FeatherTypeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cache_tags = ['feather-type-list']
 
 
-class TextFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class TextFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle text feathers."""
     
     queryset = TextFeather.objects.all()
     serializer_class = TextFeatherSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    # get_rendered_html reads these, whichever fields are asked for.
+    sparse_required_fields = ['content', 'format', 'rendered_html', 'rendered_hash', 'renderer_version']
 
 
-class PhotoFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class PhotoFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle photo feathers."""
     
     queryset = PhotoFeather.objects.all()
@@ -38,7 +57,7 @@ class PhotoFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class QuoteFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class QuoteFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle quote feathers."""
     
     queryset = QuoteFeather.objects.all()
@@ -46,7 +65,7 @@ class QuoteFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class LinkFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class LinkFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle link feathers."""
     
     queryset = LinkFeather.objects.all()
@@ -54,7 +73,7 @@ class LinkFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class VideoFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class VideoFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle video feathers."""
     
     queryset = VideoFeather.objects.all()
@@ -62,7 +81,7 @@ class VideoFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class AudioFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class AudioFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle audio feathers."""
     
     queryset = AudioFeather.objects.all()
@@ -70,7 +89,7 @@ class AudioFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class UploaderFeatherView(generics.RetrieveUpdateDestroyAPIView):
+class UploaderFeatherView(SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """Handle uploader feathers."""
     
     queryset = UploaderFeather.objects.all()
@@ -78,6 +97,36 @@ class UploaderFeatherView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
+class PostFeatherListView(PostListView):
+    """List published posts together with their feathers."""
+    
+    http_method_names = ['get', 'head', 'options']
+    sparse_required_fields = PostListView.sparse_required_fields + ['feather_type']
+    
+    def get_serializer_class(self):
+        if self.is_compact():
+            return PostFeatherCompactListSerializer
+        return PostFeatherListSerializer
+    
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        keep = sparse_field_names(['feather'], self.request)
+        if page is not None and (keep is None or keep):
+            # One query per feather type on the page instead of one per post.
+            attach_feathers(page)
+        return page
+
+
+class PostFeatherDetailView(PostDetailView):
+    """Retrieve a post together with its feather."""
+    
+    http_method_names = ['get', 'head', 'options']
+    sparse_required_fields = PostDetailView.sparse_required_fields + ['feather_type']
+    
+    def get_serializer_class(self):
+        return PostFeatherDetailSerializer
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_file(request):
@@ -86,17 +135,270 @@ def upload_file(request):
     serializer = FileUploadSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         uploaded_file = serializer.save()
-        return Response({
-            'id': uploaded_file.id,
-            'file': uploaded_file.file.url,
-            'original_name': uploaded_file.original_name,
-            'file_size': uploaded_file.file_size,
-            'file_size_human': uploaded_file.file_size_human,
-            'mime_type': uploaded_file.mime_type
-        }, status=status.HTTP_201_CREATED)
+        return Response(uploaded_file_data(uploaded_file), status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def uploaded_file_data(uploaded_file):
+    return {
+        'id': uploaded_file.id,
+        'file': uploaded_file.file.url,
+        'original_name': uploaded_file.original_name,
+        'file_size': uploaded_file.file_size,
+        'file_size_human': uploaded_file.file_size_human,
+        'mime_type': uploaded_file.mime_type,
+        'sha256': uploaded_file.sha256,
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_upload(request):
+    """Open a chunked upload session for a file of a known size."""
+    
+    serializer = UploadSessionSerializer(data=request.data)
+    if serializer.is_valid():
+        session = serializer.save(uploaded_by=request.user)
+        create_part(session.pk)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _session_response(session, status_code=status.HTTP_200_OK, **extra):
+    response = Response({**UploadSessionSerializer(session).data, **extra}, status=status_code)
+    response['Upload-Offset'] = str(session.offset)
+    return response
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session(request, session_id):
+    """Report, append a chunk to, or abort an upload session.
+    
+    ``PATCH`` takes the raw chunk as its body and its position in the
+    ``Upload-Offset`` header, which must equal the session's offset.  A
+    chunk cut short by a disconnect is kept up to where it broke off.
+    """
+    
+    if request.method == 'GET':
+        session = get_object_or_404(UploadSession, pk=session_id, uploaded_by=request.user)
+        return _session_response(session)
+    
+    if request.method == 'DELETE':
+        session = get_object_or_404(UploadSession, pk=session_id, uploaded_by=request.user)
+        session.delete()
+        remove_part(session_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    try:
+        offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+    except (KeyError, ValueError):
+        return Response({'error': 'Upload-Offset header required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return Response({'error': 'Content-Length required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        return Response(
+            {'error': f'Chunks are limited to {settings.UPLOAD_CHUNK_MAX_SIZE} bytes'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    
+    session = get_object_or_404(UploadSession, pk=session_id, uploaded_by=request.user)
+    if offset + length > session.size:
+        return _session_response(session, status.HTTP_400_BAD_REQUEST, error='Chunk exceeds the upload size')
+    try:
+        with part_lock(session.pk):
+            # Read under the lock: an earlier chunk may just have landed.
+            session.offset = get_object_or_404(
+                UploadSession.objects.values_list('offset', flat=True), pk=session.pk,
+            )
+            if offset != session.offset:
+                return _session_response(session, status.HTTP_409_CONFLICT, error='Offset mismatch')
+            
+            # The chunk streams in with no transaction open; the offset then
+            # moves only if nothing else (a commit, a delete) moved it meanwhile.
+            hasher = session_hasher(session.pk, offset)
+            written = write_chunk(session.pk, offset, request.stream, length, hasher)
+            moved = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+                offset=offset + written, updated_at=timezone.now(),
+            )
+            if not moved:
+                raise Http404
+            session.offset = offset + written
+            remember_hasher(session.pk, session.offset, hasher)
+    except PartLocked:
+        return _session_response(session, status.HTTP_409_CONFLICT, error='Another chunk is being written')
+    except FileNotFoundError:
+        # Committed or aborted meanwhile.
+        raise Http404
+    
+    if written < length:
+        return _session_response(session, status.HTTP_400_BAD_REQUEST, error='Incomplete chunk')
+    return _session_response(session)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def commit_upload(request, session_id):
+    """Turn a complete upload session into an uploaded file."""
+    
+    serializer = UploadCommitSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update(), pk=session_id, uploaded_by=request.user,
+        )
+        if session.offset != session.size:
+            return _session_response(session, status.HTTP_409_CONFLICT, error='Upload is incomplete')
+        
+        digest = session_hasher(session.pk, session.offset).hexdigest()
+        expected = serializer.validated_data.get('sha256')
+        if expected and expected.lower() != digest:
+            # The bytes on disk are not the client's file; start over.
+            session.delete()
+            remove_part(session.pk)
+            return Response({'error': 'Checksum mismatch', 'sha256': digest}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with open(part_path(session.pk), 'rb') as part:
+            uploaded_file = UploadedFile(
+                original_name=session.original_name,
+                file_size=session.size,
+                mime_type=sniff_mime_type(part.read(SNIFF_SIZE)),
+                sha256=digest,
+                uploaded_by=request.user,
+            )
+            part.seek(0)
+            content = PartFile(part)
+            # Already hashed chunk by chunk; blob storage needn't read it again.
+            content.sha256 = digest
+            uploaded_file.file.save(session.original_name, content, save=False)
+        uploaded_file.save()
+        session.delete()
+    # File system storage moved the part file; other storages copied it.
+    remove_part(session_id)
+    return Response(uploaded_file_data(uploaded_file), status=status.HTTP_201_CREATED)
+
+
+def existing_feathers(feather_types, post_ids):
+    """Return the ``(feather type, post id)`` pairs of ``post_ids`` that have a feather."""
+    taken = set()
+    for feather_type in feather_types:
+        taken.update(
+            (feather_type, post_id) for post_id in FEATHER_MODELS[feather_type].objects.filter(
+                post_id__in=post_ids,
+            ).values_list('post_id', flat=True)
+        )
+    return taken
+
+
+def taken_error(feather_type):
+    return {'post': [f'Post already has a {feather_type} feather.']}
+
+
+def invalid_bulk_response(results):
+    for result in results:
+        result['status'] = 'invalid' if 'errors' in result else 'valid'
+    return Response({'created': 0, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def mark_conflicts(feathers, conflicts):
+    """Return the results of ``feathers``, with errors on the posts that have a feather now."""
+    results = []
+    for feather_type, entries in feathers.items():
+        for result, feather, _ in entries:
+            result = {key: result[key] for key in ('index', 'type', 'post')}
+            if (feather_type, feather.post_id) in conflicts:
+                result['errors'] = taken_error(feather_type)
+            results.append(result)
+    return sorted(results, key=lambda result: result['index'])
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_create_feathers(request):
+    """Create many feathers at once, all or nothing.
+    
+    Every item is validated first; if any item is invalid nothing is
+    created and each item reports its errors.  Otherwise all feathers are
+    inserted with one ``bulk_create`` per feather type in a single
+    transaction, with the posts locked and checked for feathers again.
+    """
+    from apps.blog.models import Post
+    
+    envelope = BulkFeatherSerializer(data=request.data)
+    if not envelope.is_valid():
+        return Response(envelope.errors, status=status.HTTP_400_BAD_REQUEST)
+    items = envelope.validated_data['items']
+    
+    own_posts = set(Post.objects.filter(
+        pk__in={item['post'] for item in items}, author=request.user,
+    ).values_list('pk', flat=True))
+    taken = existing_feathers({item['type'] for item in items}, own_posts)
+    
+    results = []
+    feathers = {}
+    for index, item in enumerate(items):
+        key = (item['type'], item['post'])
+        result = {'index': index, 'type': item['type'], 'post': item['post']}
+        serializer = FEATHER_SERIALIZERS[item['type']](data=item['data'], context={'request': request})
+        if item['post'] not in own_posts:
+            result['errors'] = {'post': ['Post not found.']}
+        elif key in taken:
+            result['errors'] = taken_error(item['type'])
+        elif not serializer.is_valid():
+            result['errors'] = serializer.errors
+        else:
+            taken.add(key)
+            model = FEATHER_MODELS[item['type']]
+            data = dict(serializer.validated_data)
+            # Many-to-many values are set once the feather has a pk.
+            related = {field.name: data.pop(field.name) for field in model._meta.many_to_many if field.name in data}
+            feather = model(post_id=item['post'], **data)
+            if isinstance(feather, TextFeather):
+                # bulk_create skips save(), which renders the HTML.
+                feather.render()
+            feathers.setdefault(item['type'], []).append((result, feather, related))
+        results.append(result)
+    
+    if any('errors' in result for result in results):
+        return invalid_bulk_response(results)
+    
+    requested = {(feather_type, feather.post_id) for feather_type, entries in feathers.items() for _, feather, _ in entries}
+    try:
+        with transaction.atomic():
+            # Feathers created since the check above are seen now; later
+            # ones wait for the locks.  Creating a single feather doesn't
+            # lock its post, hence the IntegrityError below.
+            list(Post.objects.select_for_update().filter(pk__in=own_posts).values_list('pk', flat=True))
+            conflicts = existing_feathers(feathers, own_posts) & requested
+            if conflicts:
+                return invalid_bulk_response(mark_conflicts(feathers, conflicts))
+            for feather_type, entries in feathers.items():
+                created = FEATHER_MODELS[feather_type].objects.bulk_create([feather for _, feather, _ in entries])
+                for (result, _, related), feather in zip(entries, created):
+                    result.update(status='created', id=feather.pk)
+                    for name, values in related.items():
+                        getattr(feather, name).set(values)
+                # bulk_create sends no post_save, so record the feather types,
+                # queue image derivatives and count blob references here.
+                post_ids = [feather.post_id for _, feather, _ in entries]
+                claim_feather_type(post_ids, feather_type)
+                touch_posts(post_ids)
+                queue_images(FEATHER_MODELS[feather_type], created)
+                reference_blobs(FEATHER_MODELS[feather_type], created)
+    except IntegrityError:
+        conflicts = existing_feathers(feathers, own_posts) & requested
+        if not conflicts:
+            raise
+        return invalid_bulk_response(mark_conflicts(feathers, conflicts))
+    return Response({'created': len(results), 'results': results}, status=status.HTTP_201_CREATED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_text_feather(request, post_id):
@@ -120,7 +422,7 @@ def create_photo_feather(request, post_id):
     from apps.blog.models import Post
     post = get_object_or_404(Post, id=post_id, author=request.user)
     
-    serializer = PhotoFeatherSerializer(data=request.data)
+    serializer = PhotoFeatherSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         photo_feather = serializer.save(post=post)
         return Response(PhotoFeatherSerializer(photo_feather).data, status=status.HTTP_201_CREATED)
@@ -165,7 +467,7 @@ def create_video_feather(request, post_id):
     from apps.blog.models import Post
     post = get_object_or_404(Post, id=post_id, author=request.user)
     
-    serializer = VideoFeatherSerializer(data=request.data)
+    serializer = VideoFeatherSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         video_feather = serializer.save(post=post)
         return Response(VideoFeatherSerializer(video_feather).data, status=status.HTTP_201_CREATED)
@@ -180,7 +482,7 @@ def create_audio_feather(request, post_id):
     from apps.blog.models import Post
     post = get_object_or_404(Post, id=post_id, author=request.user)
     
-    serializer = AudioFeatherSerializer(data=request.data)
+    serializer = AudioFeatherSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         audio_feather = serializer.save(post=post)
         return Response(AudioFeatherSerializer(audio_feather).data, status=status.HTTP_201_CREATED)
@@ -195,7 +497,7 @@ def create_uploader_feather(request, post_id):
     from apps.blog.models import Post
     post = get_object_or_404(Post, id=post_id, author=request.user)
     
-    serializer = UploaderFeatherSerializer(data=request.data)
+    serializer = UploaderFeatherSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         uploader_feather = serializer.save(post=post)
         return Response(UploaderFeatherSerializer(uploader_feather).data, status=status.HTTP_201_CREATED)
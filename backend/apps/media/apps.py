@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class MediaConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.media'
+
+    def ready(self):
+        import atexit
+        from .derivatives import derivative_pool
+        from .signals import connect_signals
+
+        connect_signals()
+        # Finish building queued derivatives when the worker shuts down.
+        atexit.register(derivative_pool.flush)
@@ -0,0 +1,227 @@
+"""
+Resized image derivatives.
+
+Every image field listed in ``IMAGE_FIELDS`` gets a JSON column named
+``<field>_derivatives`` holding the manifest of its derivatives: the
+source file name, its dimensions, and one variant per size in
+``SIZES`` and format in ``FORMATS``, EXIF stripped.  Saving a new image
+clears the manifest (see ``signals``) and queues the image on
+``derivative_pool``, whose worker threads build the variants and store
+the manifest.  Serializers turn manifests into ``srcset`` strings.
+
+``make_derivatives`` must not touch the ORM: the backfill command calls
+it in worker processes.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# (model, image field, width field, height field)
+IMAGE_FIELDS = [
+    ('blog.Post', 'featured_image', None, None),
+    ('feathers.PhotoFeather', 'image', 'width', 'height'),
+    ('feathers.LinkFeather', 'thumbnail', None, None),
+    ('accounts.User', 'avatar', None, None),
+]
+
+# Largest width and height of each size, smallest first.
+SIZES = {
+    'thumbnail': 320,
+    'card': 800,
+    'full': 1600,
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def manifest_field(field):
+    return f'{field}_derivatives'
+
+
+def _quality():
+    return getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 82)
+
+
+def _encode(image, format):
+    icc_profile = image.info.get('icc_profile')
+    if format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten onto white.
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, format, quality=_quality(), icc_profile=icc_profile)
+    return buffer.getvalue()
+
+
+def make_derivatives(name):
+    """Build and store the variants of image ``name``; returns its manifest.
+
+    Returns None if the file is missing or isn't an image.
+    """
+    try:
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError):
+        logger.warning('Cannot build derivatives of %s', name, exc_info=True)
+        return None
+
+    # Apply the EXIF orientation, then drop all metadata but the colour profile.
+    image = ImageOps.exif_transpose(image)
+    image.info = {key: value for key, value in image.info.items() if key == 'icc_profile'}
+    stem = posixpath.splitext(name)[0]
+    variants = []
+    previous = None
+    for size, bound in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((bound, bound), Image.LANCZOS)
+        # Images smaller than a size are never upscaled, so it would
+        # repeat the previous one.
+        if resized.size == previous:
+            continue
+        previous = resized.size
+        for format, (pillow_format, extension) in FORMATS.items():
+            stored = default_storage.save(
+                f'derivatives/{stem}-{size}.{extension}', ContentFile(_encode(resized, pillow_format)),
+            )
+            variants.append({
+                'size': size,
+                'format': format,
+                'name': stored,
+                'width': resized.width,
+                'height': resized.height,
+            })
+    return {'source': name, 'width': image.width, 'height': image.height, 'variants': variants}
+
+
+def delete_variants(*manifests):
+    for manifest in manifests:
+        for variant in (manifest or {}).get('variants', []):
+            default_storage.delete(variant['name'])
+
+
+def image_fields(model):
+    """Return the names of the model's image fields that have derivatives."""
+    return [field for label, field, _, _ in IMAGE_FIELDS if apps.get_model(label) is model]
+
+
+def image_field_spec(model, field):
+    for label, name, width_field, height_field in IMAGE_FIELDS:
+        if apps.get_model(label) is model and name == field:
+            return width_field, height_field
+    raise LookupError(f'{model._meta.label}.{field} has no derivatives')
+
+
+def store_derivatives(model, pk, field, manifest):
+    """Store the manifest of a row's image, unless the image changed since.
+
+    Returns True if it was stored.  Variants of a manifest that isn't
+    stored, and of the one it replaces, are deleted.
+    """
+    width_field, height_field = image_field_spec(model, field)
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).first()
+        if instance is None or getattr(instance, field).name != manifest['source']:
+            delete_variants(manifest)
+            return False
+        replaced = getattr(instance, manifest_field(field))
+        setattr(instance, manifest_field(field), manifest)
+        update_fields = [manifest_field(field), 'updated_at']
+        if width_field:
+            setattr(instance, width_field, manifest['width'])
+            setattr(instance, height_field, manifest['height'])
+            update_fields += [width_field, height_field]
+        # A regular save, so post signals invalidate cached responses.
+        instance.save(update_fields=update_fields)
+        transaction.on_commit(lambda: delete_variants(replaced))
+    return True
+
+
+def refresh_derivatives(model, pk, field):
+    """Build and store the derivatives of a row's current image."""
+    name = model.objects.filter(pk=pk).values_list(field, flat=True).first()
+    if not name:
+        return False
+    manifest = make_derivatives(name)
+    return manifest is not None and store_derivatives(model, pk, field, manifest)
+
+
+class DerivativePool:
+    """Worker threads building derivatives of newly saved images."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+        self._executor = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, model, pk, field):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='derivatives')
+            future = self._executor.submit(self._refresh, model, pk, field)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def flush(self):
+        """Wait for every queued image; returns the number waited for."""
+        with self._lock:
+            futures = set(self._futures)
+        wait(futures)
+        return len(futures)
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _refresh(self, model, pk, field):
+        try:
+            return refresh_derivatives(model, pk, field)
+        except Exception:
+            # Nobody reads the future, so this is the only trace of the error.
+            logger.exception('Failed to build derivatives of %s %s', model._meta.label, pk)
+            return False
+        finally:
+            connection.close()
+
+
+derivative_pool = DerivativePool()
+
+
+def queue_images(model, instances):
+    """Queue the images of rows saved without post_save, e.g. by ``bulk_create``."""
+    for instance in instances:
+        for field in image_fields(model):
+            if getattr(instance, field):
+                transaction.on_commit(
+                    lambda pk=instance.pk, field=field: derivative_pool.submit(model, pk, field)
+                )
+
+
+def srcset(manifest, request=None):
+    """Return ``{format: srcset}`` for a manifest, or None if it has no variants."""
+    candidates = {}
+    for variant in (manifest or {}).get('variants', []):
+        url = default_storage.url(variant['name'])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        candidates.setdefault(variant['format'], []).append(f"{url} {variant['width']}w")
+    return {format: ', '.join(urls) for format, urls in candidates.items()} or None
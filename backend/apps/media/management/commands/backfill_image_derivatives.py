@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.media.derivatives import IMAGE_FIELDS, make_derivatives, manifest_field, store_derivatives
+
+
+def build_many(names):
+    return [make_derivatives(name) for name in names]
+
+
+class Command(BaseCommand):
+    help = 'Build missing image derivatives, using a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild the derivatives of every image.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or 1
+        chunk_size = options['chunk_size']
+        built = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for label, field, _, _ in IMAGE_FIELDS:
+                model = apps.get_model(label)
+                rows = model.objects.exclude(Q(**{field: ''}) | Q(**{f'{field}__isnull': True})).order_by('pk')
+                if not options['all']:
+                    rows = rows.filter(**{manifest_field(field): {}})
+                built += self.backfill(pool, model, field, rows, workers, chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives of {built} images.'))
+
+    def backfill(self, pool, model, field, rows, workers, chunk_size):
+        built = 0
+        last_pk = 0
+        while True:
+            # One chunk per worker in flight keeps memory bounded.
+            chunks = []
+            for _ in range(workers):
+                chunk = list(rows.filter(pk__gt=last_pk).values_list('pk', field)[:chunk_size])
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                last_pk = chunk[-1][0]
+            if not chunks:
+                return built
+            # Workers only resize; manifests are stored here.
+            for chunk, manifests in zip(chunks, pool.map(build_many, [[name for _, name in c] for c in chunks])):
+                for (pk, _), manifest in zip(chunk, manifests):
+                    if manifest is not None and store_derivatives(model, pk, field, manifest):
+                        built += 1
@@ -0,0 +1,18 @@
+from rest_framework import serializers
+
+from .derivatives import manifest_field, srcset
+
+
+class SrcsetField(serializers.Field):
+    """Read-only ``{format: srcset}`` of an image field's derivatives.
+
+    None until the derivatives of the current image are built.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        kwargs['source'] = manifest_field(image_field)
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return srcset(value, self.context.get('request'))
@@ -0,0 +1,66 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+
+from .derivatives import IMAGE_FIELDS, delete_variants, derivative_pool, image_fields, manifest_field
+
+
+def _file_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def remember_images(sender, instance, **kwargs):
+    # Read __dict__ so deferred fields aren't loaded.
+    instance._stored_images = {
+        field: _file_name(instance.__dict__[field])
+        for field in image_fields(sender) if field in instance.__dict__
+    }
+
+
+def clear_stale_derivatives(sender, instance, update_fields=None, **kwargs):
+    """Drop the manifest of a replaced image; its variants are deleted after commit."""
+    instance._changed_images = []
+    for field in image_fields(sender):
+        if update_fields is not None and field not in update_fields:
+            continue
+        if field not in instance.__dict__:
+            continue
+        name = _file_name(instance.__dict__[field])
+        if instance.pk is not None and instance._stored_images.get(field) == name:
+            continue
+        instance._changed_images.append(field)
+        stale = instance.__dict__.get(manifest_field(field))
+        if stale:
+            transaction.on_commit(lambda stale=stale: delete_variants(stale))
+        setattr(instance, manifest_field(field), {})
+
+
+def queue_derivatives(sender, instance, **kwargs):
+    for field in instance._changed_images:
+        instance._stored_images[field] = _file_name(getattr(instance, field))
+        if instance._stored_images[field]:
+            transaction.on_commit(lambda field=field: derivative_pool.submit(sender, instance.pk, field))
+    instance._changed_images = []
+
+
+def load_manifests(sender, instance, **kwargs):
+    # The row is gone by post_delete; load deferred manifests while it exists.
+    missing = [manifest_field(field) for field in image_fields(sender) if manifest_field(field) not in instance.__dict__]
+    if missing:
+        stored = sender.objects.filter(pk=instance.pk).values(*missing).first() or {}
+        instance.__dict__.update(stored)
+
+
+def delete_derivatives(sender, instance, **kwargs):
+    manifests = [instance.__dict__.get(manifest_field(field)) for field in image_fields(sender)]
+    transaction.on_commit(lambda: delete_variants(*manifests))
+
+
+def connect_signals():
+    for label in {label for label, _, _, _ in IMAGE_FIELDS}:
+        model = apps.get_model(label)
+        post_init.connect(remember_images, sender=model, dispatch_uid=f'media-remember-{label}')
+        pre_save.connect(clear_stale_derivatives, sender=model, dispatch_uid=f'media-clear-{label}')
+        post_save.connect(queue_derivatives, sender=model, dispatch_uid=f'media-queue-{label}')
+        pre_delete.connect(load_manifests, sender=model, dispatch_uid=f'media-load-{label}')
+        post_delete.connect(delete_derivatives, sender=model, dispatch_uid=f'media-delete-{label}')
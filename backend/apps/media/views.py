@@ -0,0 +1,234 @@
+"""
+Media delivery.
+
+``serve_media`` serves the public files under ``MEDIA_ROOT`` in every
+environment: those under ``MEDIA_PUBLIC_PREFIXES`` and blobs referenced
+by published feather fields.  Other uploads stay reachable only through
+the API.  It answers conditional requests from the file's ETag and Last-Modified,
+serves single byte ranges (honouring ``If-Range``) so video and audio can
+seek, and marks blobs, whose names never change meaning, as immutable.
+
+With ``MEDIA_SENDFILE_BACKEND`` set, the bytes are left to the front
+proxy through ``X-Sendfile`` or ``X-Accel-Redirect``, which handles
+ranges itself.  Otherwise the file is streamed by ``FileResponse``, which
+WSGI servers with ``wsgi.file_wrapper`` (e.g. gunicorn) send with
+``os.sendfile``.
+"""
+import io
+import mimetypes
+import os
+import re
+import stat
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from apps.feathers.storage import is_blob, is_public_blob
+from apps.feathers.uploads import READ_SIZE
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Types browsers may render inline; anything else, e.g. HTML or SVG that
+# could run scripts on this origin, is sent as an attachment.
+INLINE_TYPES = ('image/', 'audio/', 'video/', 'text/plain', 'application/pdf')
+ATTACHMENT_TYPES = ('image/svg+xml',)
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """The bytes ``[start, start + length)`` of a file, as a seekable file object.
+
+    The file must be unbuffered, so its descriptor is always at the
+    range's position: WSGI servers that ``sendfile`` from ``fileno()``
+    then send exactly the response's Content-Length from there.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.start = start
+        self.length = length
+        file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.tell(), io.SEEK_END: self.length}[whence]
+        position = min(max(base + offset, 0), self.length)
+        self.file.seek(self.start + position)
+        return position
+
+    def read(self, size=-1):
+        remaining = self.length - self.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size) if size > 0 else b''
+
+    def close(self):
+        self.file.close()
+
+
+def media_path(path):
+    """Return the normalized name and file system path of media file ``path``.
+
+    Raises Http404 for paths outside ``MEDIA_ROOT`` and for files that
+    aren't public, including blobs still being written.
+    """
+    try:
+        full_path = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    name = Path(os.path.relpath(full_path, settings.MEDIA_ROOT)).as_posix()
+    if is_blob(name):
+        public = is_public_blob(name)
+    else:
+        public = name.startswith(tuple(settings.MEDIA_PUBLIC_PREFIXES))
+    if not public:
+        raise Http404('Not found')
+    return name, full_path
+
+
+def file_etag(file_stat):
+    # nginx's format, so validators don't change when the proxy takes over.
+    return f'"{int(file_stat.st_mtime):x}-{file_stat.st_size:x}"'
+
+
+def content_type_of(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding:
+        # Keep browsers from decompressing e.g. .tar.gz files.
+        return 'application/octet-stream'
+    return content_type or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """Return ``(start, length)`` of a ``Range`` header asking for one byte range.
+
+    Returns None, to send the whole file, for headers that are malformed
+    or ask for several ranges.  Raises RangeNotSatisfiable if the range
+    lies past the end of the file.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable
+        start = max(size - suffix, 0)
+        return start, size - start
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end - start + 1
+
+
+def range_applies(request, etag, last_modified):
+    """Return whether the request's ``If-Range`` validator, if any, still matches."""
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        # Weak ETags never match.
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def set_media_headers(response, name, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if is_blob(name):
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+    return response
+
+
+def offload_response(backend, name, full_path):
+    """Return an empty response telling the front proxy to send the file."""
+    response = HttpResponse(content_type=content_type_of(name))
+    if backend == 'x-sendfile':
+        response['X-Sendfile'] = str(full_path)
+    elif backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/internal-media/')
+        response['X-Accel-Redirect'] = quote(f"{prefix.rstrip('/')}/{name}")
+    else:
+        raise ImproperlyConfigured(f'Unknown MEDIA_SENDFILE_BACKEND {backend!r}')
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a file under MEDIA_ROOT, with byte ranges and cache validators."""
+    name, full_path = media_path(path)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Not found')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('Not found')
+    size = file_stat.st_size
+    etag = file_etag(file_stat)
+    last_modified = int(file_stat.st_mtime)
+
+    # 304 Not Modified, or 412 for failed If-Match/If-Unmodified-Since.
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return set_media_headers(response, name, etag, last_modified)
+
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', '')
+    if backend:
+        return set_media_headers(offload_response(backend, name, full_path), name, etag, last_modified)
+
+    byte_range = None
+    if 'Range' in request.headers and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return set_media_headers(response, name, etag, last_modified)
+    start, length = byte_range or (0, size)
+
+    content_type = content_type_of(name)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = length
+    else:
+        try:
+            file = open(full_path, 'rb', buffering=0)
+        except OSError:
+            raise Http404('Not found')
+        response = FileResponse(FileRange(file, start, length), content_type=content_type)
+        response.block_size = READ_SIZE
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    response['Content-Disposition'] = content_disposition_header(
+        not content_type.startswith(INLINE_TYPES) or content_type in ATTACHMENT_TYPES,
+        os.path.basename(name),
+    )
+    return set_media_headers(response, name, etag, last_modified)
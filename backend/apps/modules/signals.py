@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.blog.caching import response_cache
+from .models import Module, SitemapEntry, Theme
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def invalidate_module_list(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit('module-list')
+
+
+@receiver(post_save, sender=SitemapEntry)
+@receiver(post_delete, sender=SitemapEntry)
+def invalidate_sitemap_entry_list(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit('sitemap-entry-list')
+
+
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+def invalidate_theme_list(sender, instance, **kwargs):
+    response_cache.invalidate_on_commit('theme-list')
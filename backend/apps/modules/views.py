@@ -6,6 +6,7 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from apps.blog.conditional import ConditionalListMixin
 from .models import (
     Module, CacheEntry, WebMention, SitemapEntry, MAPTCHAChallenge,
     CodeHighlight, EmbedProvider, PostRights, Theme
@@ -17,12 +18,13 @@ from .serializers import (
 )
 
 
-class ModuleListView(generics.ListAPIView):
+class ModuleListView(ConditionalListMixin, generics.ListAPIView):
     """List all available modules."""
     
     queryset = Module.objects.all()
     serializer_class = ModuleSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    version_tags = ['module-list']
 
 
 class WebMentionListView(generics.ListCreateAPIView):
@@ -33,12 +35,14 @@ class WebMentionListView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class SitemapEntryListView(generics.ListAPIView):
+class SitemapEntryListView(ConditionalListMixin, generics.ListAPIView):
     """List sitemap entries."""
     
     queryset = SitemapEntry.objects.filter(is_active=True)
     serializer_class = SitemapEntrySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    version_tags = ['sitemap-entry-list']
+    last_modified_field = 'last_modified'
 
 
 class CodeHighlightListView(generics.ListAPIView):
@@ -57,12 +61,13 @@ class EmbedProviderListView(generics.ListAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class ThemeListView(generics.ListAPIView):
+class ThemeListView(ConditionalListMixin, generics.ListAPIView):
     """List available themes."""
     
     queryset = Theme.objects.filter(is_active=True)
     serializer_class = ThemeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    version_tags = ['theme-list']
 
 
 @api_view(['GET'])
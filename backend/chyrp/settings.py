@@ -39,6 +39,7 @@ LOCAL_APPS = [
     'apps.blog',
     'apps.feathers',
     'apps.modules',
+    'apps.media',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -181,6 +183,8 @@ SIMPLE_JWT = {
 }
 
 # Cache Configuration
+# The locmem cache is per process; use a shared backend (Redis, Memcached)
+# when running several workers so response cache invalidation reaches all.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -188,5 +192,80 @@ CACHES = {
     }
 }
 
+# Buffered view counting: views are written to the database at most
+# this many seconds late, or earlier once this many posts are pending.
+VIEW_COUNT_FLUSH_INTERVAL = config('VIEW_COUNT_FLUSH_INTERVAL', default=5, cast=int)
+VIEW_COUNT_MAX_PENDING = config('VIEW_COUNT_MAX_PENDING', default=1000, cast=int)
+
+# PostView events are spooled to disk and bulk-loaded in the background.
+POST_VIEW_SPOOL_DIR = BASE_DIR / config('POST_VIEW_SPOOL_DIR', default='var/spool')
+POST_VIEW_SPOOL_SEGMENT_SIZE = config('POST_VIEW_SPOOL_SEGMENT_SIZE', default=1000, cast=int)
+POST_VIEW_SPOOL_FLUSH_INTERVAL = config('POST_VIEW_SPOOL_FLUSH_INTERVAL', default=10, cast=int)
+POST_VIEW_SPOOL_BATCH_SIZE = config('POST_VIEW_SPOOL_BATCH_SIZE', default=500, cast=int)
+
+# PostView analytics: raw views are rolled up per post and day, and raw
+# rows older than POST_VIEW_RETENTION_DAYS are pruned (0 keeps them).
+POST_VIEW_RETENTION_DAYS = config('POST_VIEW_RETENTION_DAYS', default=90, cast=int)
+POST_VIEW_PRUNE_BATCH_SIZE = config('POST_VIEW_PRUNE_BATCH_SIZE', default=5000, cast=int)
+POST_VIEW_TOP_REFERERS = config('POST_VIEW_TOP_REFERERS', default=10, cast=int)
+
+# Like counting: posts with at least LIKE_COUNTER_SHARD_THRESHOLD likes
+# spread updates over LIKE_COUNTER_SHARDS rows (0 disables sharding).
+LIKE_COUNTER_SHARDS = config('LIKE_COUNTER_SHARDS', default=0, cast=int)
+LIKE_COUNTER_SHARD_THRESHOLD = config('LIKE_COUNTER_SHARD_THRESHOLD', default=1000, cast=int)
+
+# Comment threads are nested at most this many levels deep in API responses.
+COMMENT_MAX_DEPTH = config('COMMENT_MAX_DEPTH', default=8, cast=int)
+
+# Related posts: how many are stored per post, how many candidates are
+# scored per tag/category lookup, and how long edits wait before refresh.
+RELATED_POSTS_COUNT = config('RELATED_POSTS_COUNT', default=5, cast=int)
+RELATED_POSTS_CANDIDATES = config('RELATED_POSTS_CANDIDATES', default=200, cast=int)
+RELATED_POSTS_REFRESH_DELAY = config('RELATED_POSTS_REFRESH_DELAY', default=10, cast=int)
+
+# Anonymous list responses are cached until a signal invalidates one of
+# their tags, and at most this many seconds.
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Most posts one batch stats request (posts/stats/?ids=) may ask for.
+POST_STATS_MAX_IDS = config('POST_STATS_MAX_IDS', default=100, cast=int)
+
+# Most feathers one bulk creation request (feathers/bulk/) may create.
+FEATHER_BULK_MAX_ITEMS = config('FEATHER_BULK_MAX_ITEMS', default=500, cast=int)
+
+# Slugs remembered per process for slug-addressed post pages.
+POST_SLUG_CACHE_SIZE = config('POST_SLUG_CACHE_SIZE', default=10000, cast=int)
+
+# Resized image derivatives: worker threads per process and the WebP/JPEG
+# quality they are encoded at.
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=82, cast=int)
+
+# Chunked uploads: part files are kept in UPLOAD_SESSION_DIR, and sessions
+# idle for UPLOAD_SESSION_MAX_AGE_HOURS are removed by sweep_upload_sessions.
+UPLOAD_SESSION_DIR = BASE_DIR / config('UPLOAD_SESSION_DIR', default='var/uploads')
+UPLOAD_MAX_SIZE = config('UPLOAD_MAX_SIZE', default=2 * 1024 ** 3, cast=int)
+UPLOAD_CHUNK_MAX_SIZE = config('UPLOAD_CHUNK_MAX_SIZE', default=16 * 1024 ** 2, cast=int)
+UPLOAD_SESSION_MAX_AGE_HOURS = config('UPLOAD_SESSION_MAX_AGE_HOURS', default=24, cast=int)
+
+# Feathers media is stored once per content hash; blobs unreferenced for
+# this long are deleted by collect_media_garbage.
+MEDIA_BLOB_GC_GRACE_HOURS = config('MEDIA_BLOB_GC_GRACE_HOURS', default=24, cast=int)
+
+# Media files are served with byte ranges by apps.media.views.serve_media.
+# Set MEDIA_SENDFILE_BACKEND to 'x-sendfile' (Apache mod_xsendfile) or
+# 'x-accel-redirect' (nginx, with an internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) to let the proxy send
+# the bytes.  Blobs are cached forever, other files MEDIA_CACHE_MAX_AGE seconds.
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/internal-media/')
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=3600, cast=int)
+# Only files under these prefixes, and blobs of published feathers, are
+# served; uploads are not.  Keep the proxy's media location to the same.
+MEDIA_PUBLIC_PREFIXES = config(
+    'MEDIA_PUBLIC_PREFIXES',
+    default='avatars/,posts/,derivatives/,feathers/photos/,feathers/links/,feathers/videos/,feathers/audio/,themes/',
+).split(',')
+
 # Email Configuration (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -1,10 +1,14 @@
 """
 URL configuration for chyrp project.
 """
+import re
+from urllib.parse import urlsplit
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from apps.media.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,7 +18,12 @@ urlpatterns = [
     path('api/modules/', include('apps.modules.urls')),
 ]
 
-# Serve media files in development
+# Serve media files, unless MEDIA_URL points at another host
+if not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
+
+# Serve static files in development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -22,9 +22,8 @@ export function PostDetailPage() {
   const { data: post, isLoading, error } = useQuery<Post>(
     ['post', slug],
     async () => {
-      const response = await api.get(`/blog/posts/?slug=${slug}`)
-      const posts = response.data.results || response.data
-      return posts.find((p: Post) => p.slug === slug)
+      const response = await api.get(`/blog/posts/by-slug/${slug}/`)
+      return response.data
     }
   )
 